@@ -1,5 +1,3 @@
-import logging
-
 from flask import Flask
 from flask_assets import Bundle, Environment
 from flask_compress import Compress
@@ -7,16 +5,37 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_login import LoginManager
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 from flask_talisman import Talisman
 from flask_wtf.csrf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from app.admission import LoginAdmission
+from app.blocklist import DomainBlocklist
+from app.cache import UserCache
+from app.deletion import OrganisationDeleter
+from app.deliverability import DeliverabilityChecker
+from app.domains import DomainResolver
+from app.fragments import FragmentCache
+from app.logs import RequestLogging
+from app.metrics import Metrics
+from app.occupancy import OccupancyCache
+from app.passwords import PasswordHasher
+from app.pool import DatabasePool
+from app.precompress import PrecompressedStatic
+from app.ratelimit import HybridStorage  # noqa: F401 registers the hybrid+redis:// storage scheme
+from app.replicas import ReplicaRouter, RoutingSQLAlchemy
+from app.search import MemberSearch
 from config import Config
 
 assets = Environment()
+blocklist = DomainBlocklist()
 compress = Compress()
 csrf = CSRFProtect()
-db = SQLAlchemy()
+database_pool = DatabasePool()
+db = RoutingSQLAlchemy()
+deliverability = DeliverabilityChecker()
+domains = DomainResolver()
+fragment_cache = FragmentCache()
 limiter = Limiter(key_func=get_remote_address, default_limits=["2 per second", "60 per minute"])
 login = LoginManager()
 login.login_message_category = "info"
@@ -24,13 +43,27 @@ login.login_view = "user.login"
 login.needs_refresh_message = "To protect your account, please log in again to access this page."
 login.needs_refresh_message_category = "info"
 login.refresh_view = "user.login"
+login_admission = LoginAdmission()
+member_search = MemberSearch()
+metrics = Metrics()
 migrate = Migrate()
+occupancy = OccupancyCache()
+organisation_deleter = OrganisationDeleter()
+password_hasher = PasswordHasher()
+precompressed_static = PrecompressedStatic()
+replicas = ReplicaRouter()
+request_logging = RequestLogging()
 talisman = Talisman()
+user_cache = UserCache()
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # Take the client's address from the X-Forwarded-For hops added by trusted proxies, such as the Heroku router,
+    # so rate limits and log in admission control key on the client rather than the proxy
+    if app.config.get("PROXY_FIX_X_FOR"):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
     app.jinja_env.lstrip_blocks = True
     app.jinja_env.trim_blocks = True
 
@@ -49,13 +82,27 @@ def create_app(config_class=Config):
 
     # Initialise app extensions
     assets.init_app(app)
+    blocklist.init_app(app)
     compress.init_app(app)
     csrf.init_app(app)
+    database_pool.init_app(app)
     db.init_app(app)
+    deliverability.init_app(app)
+    domains.init_app(app)
+    fragment_cache.init_app(app)
     limiter.init_app(app)
     login.init_app(app)
+    login_admission.init_app(app)
+    member_search.init_app(app)
+    metrics.init_app(app)
     migrate.init_app(app, db)
+    occupancy.init_app(app)
+    organisation_deleter.init_app(app)
+    password_hasher.init_app(app)
+    replicas.init_app(app)
+    request_logging.init_app(app)
     talisman.init_app(app, content_security_policy=csp)
+    user_cache.init_app(app)
 
     # Create static asset bundles
     css = Bundle("src/css/*.css", filters="cssmin", output="dist/css/custom-%(version)s.min.css")
@@ -64,6 +111,7 @@ def create_app(config_class=Config):
         assets.register("css", css)
     if "js" not in assets:
         assets.register("js", js)
+    precompressed_static.init_app(app)
 
     # Register blueprints
     from app.main import bp as main_bp
@@ -74,10 +122,6 @@ def create_app(config_class=Config):
     app.register_blueprint(main_bp)
     app.register_blueprint(organisation_bp)
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(logging.INFO)
-    app.logger.addHandler(stream_handler)
-    app.logger.setLevel(logging.INFO)
     app.logger.info("Startup")
 
     return app
@@ -0,0 +1,134 @@
+import collections
+import hashlib
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from flask_limiter.util import get_remote_address
+from limits import parse
+from werkzeug.exceptions import TooManyRequests
+
+OUTCOMES = ("accepted", "shed_account", "shed_ip", "shed_budget")
+
+
+class SlidingWindow(object):
+    """Approximate sliding window counter over two fixed windows in the rate limiter's storage.
+
+    The previous window's count is weighted by how much of it still overlaps the sliding window, so a burst
+    at the end of one window still counts against the start of the next.
+    """
+
+    def __init__(self, name, limit):
+        item = parse(limit)
+        self.name = name
+        self.amount = item.amount
+        self.seconds = item.get_expiry()
+
+    def key(self, value, window):
+        return f"login_admission/{self.name}/{value}/{window}"
+
+    def count(self, storage, value, now):
+        window, elapsed = divmod(now, self.seconds)
+        previous = storage.get(self.key(value, int(window) - 1))
+        current = storage.get(self.key(value, int(window)))
+        return previous * (1 - elapsed / self.seconds) + current
+
+    def retry_after(self, storage, value, now):
+        """Seconds until the previous window has decayed enough to admit another attempt."""
+        window, elapsed = divmod(now, self.seconds)
+        previous = storage.get(self.key(value, int(window) - 1))
+        current = storage.get(self.key(value, int(window)))
+        if previous and current < self.amount:
+            overlap = (self.amount - 1 - current) / previous
+            return max(1, math.ceil((1 - overlap) * self.seconds - elapsed))
+        return max(1, math.ceil(self.seconds - elapsed))
+
+    def hit(self, storage, value, now):
+        # Kept for two windows, as the next window still reads this one's count
+        storage.incr(self.key(value, int(now // self.seconds)), self.seconds * 2)
+
+
+def account_key(email_address):
+    # Hash email addresses, so they aren't stored in shared rate limit storage
+    return hashlib.sha256(email_address.lower().strip().encode("UTF-8")).hexdigest()[:32]
+
+
+class LoginAdmission(object):
+    """Admission control for password checks at log in, shedding attempts with a 429 before bcrypt runs.
+
+    Attempts from an IP address are limited by LOGIN_IP_LIMIT, failed attempts for an account from an IP address
+    by LOGIN_ACCOUNT_LIMIT, and failed attempts for an account from anywhere by the higher LOGIN_ACCOUNT_TOTAL_LIMIT,
+    all as sliding windows in the rate limiter's storage and skipped when rate limiting is disabled. Failures from
+    other addresses only shed the owner's log in once they reach the total. At most LOGIN_HASH_BUDGET password
+    checks for log ins run at once in each process, and attempts beyond that are shed straight away rather than
+    queued for the password hashing pool.
+    """
+
+    def __init__(self, app=None):
+        self.account = SlidingWindow("account", "10 per 15 minutes")
+        self.account_total = SlidingWindow("account_total", "100 per 15 minutes")
+        self.ip = SlidingWindow("ip", "50 per 15 minutes")
+        self.budget = 4
+        self.in_flight = 0
+        self.counts = collections.Counter({outcome: 0 for outcome in OUTCOMES})
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.account = SlidingWindow("account", app.config.get("LOGIN_ACCOUNT_LIMIT", "10 per 15 minutes"))
+        self.account_total = SlidingWindow(
+            "account_total", app.config.get("LOGIN_ACCOUNT_TOTAL_LIMIT", "100 per 15 minutes")
+        )
+        self.ip = SlidingWindow("ip", app.config.get("LOGIN_IP_LIMIT", "50 per 15 minutes"))
+        self.budget = app.config.get("LOGIN_HASH_BUDGET", 4)
+        app.extensions["login_admission"] = self
+
+    @contextmanager
+    def attempt(self, email_address):
+        """Admit a log in attempt for the duration of its password check, or raise TooManyRequests."""
+        from app import limiter
+
+        now = time.time()
+        ip, account = get_remote_address(), account_key(email_address)
+        if limiter.enabled:
+            for outcome, window, value in (
+                ("shed_ip", self.ip, ip),
+                ("shed_account", self.account, f"{account}/{ip}"),
+                ("shed_account", self.account_total, account),
+            ):
+                if window.count(limiter.storage, value, now) >= window.amount:
+                    self._shed(outcome, window.retry_after(limiter.storage, value, now))
+            self.ip.hit(limiter.storage, ip, now)
+
+        with self._lock:
+            admitted = self.in_flight < self.budget
+            if admitted:
+                self.in_flight += 1
+        if not admitted:
+            self._shed("shed_budget", 1)
+
+        self._count("accepted")
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def failed(self, email_address):
+        """Count a failed log in against the account, from this IP address and in total, whether or not it exists."""
+        from app import limiter
+
+        if limiter.enabled:
+            now, account = time.time(), account_key(email_address)
+            self.account.hit(limiter.storage, f"{account}/{get_remote_address()}", now)
+            self.account_total.hit(limiter.storage, account, now)
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def _shed(self, outcome, retry_after):
+        self._count(outcome)
+        raise TooManyRequests("Too many log in attempts. Please try again later.", retry_after=retry_after)
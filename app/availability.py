@@ -0,0 +1,111 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import pytz
+from sqlalchemy import DateTime, and_, column, func, select, values
+
+from app import db
+from app.models import Booking, Desk
+from app.timezones import get_zone
+
+
+def overlaps(starts_at, ends_at):
+    """SQL condition for bookings overlapping a period, served by the ex_booking_desk_period GiST index."""
+    return func.tstzrange(Booking.starts_at, Booking.ends_at).op("&&")(func.tstzrange(starts_at, ends_at))
+
+
+def day_bounds(day, timezone="UTC"):
+    """Return the UTC start and end of a calendar day in a timezone."""
+    zone = get_zone(timezone)
+    starts_at = zone.localize(datetime.combine(day, time.min)).astimezone(pytz.utc)
+    ends_at = zone.localize(datetime.combine(day + timedelta(days=1), time.min)).astimezone(pytz.utc)
+    return starts_at, ends_at
+
+
+class DeskIntervals(object):
+    """Sorted, non-overlapping booking intervals for one desk.
+
+    Bookings for a desk never overlap, so ordering by start also orders by end, and a conflict check is a
+    single binary search over the end times.
+    """
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [starts_at for starts_at, _ in intervals]
+        self.ends = [ends_at for _, ends_at in intervals]
+
+    def conflicts(self, starts_at, ends_at):
+        # The first interval ending after the requested start is the only one that can overlap it
+        i = bisect_right(self.ends, starts_at)
+        return i < len(self.starts) and self.starts[i] < ends_at
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class AvailabilityIndex(object):
+    """Interval index of every booking on an organisation's desks over a period, loaded in one query."""
+
+    def __init__(self, desk_ids, bookings):
+        self.desk_ids = list(desk_ids)
+        intervals = defaultdict(list)
+        for desk_id, starts_at, ends_at in bookings:
+            intervals[desk_id].append((starts_at, ends_at))
+        self.desks = {desk_id: DeskIntervals(intervals[desk_id]) for desk_id in self.desk_ids}
+
+    @classmethod
+    def load(cls, organisation_id, starts_at, ends_at):
+        desks = db.session.query(Desk.id).filter(Desk.organisation_id == organisation_id).order_by(Desk.name)
+        desk_ids = [desk_id for desk_id, in desks]
+        bookings = (
+            db.session.query(Booking.desk_id, Booking.starts_at, Booking.ends_at)
+            .join(Desk)
+            .filter(Desk.organisation_id == organisation_id, overlaps(starts_at, ends_at))
+            .all()
+        )
+        return cls(desk_ids, bookings)
+
+    @classmethod
+    def load_day(cls, organisation_id, day, timezone="UTC"):
+        return cls.load(organisation_id, *day_bounds(day, timezone))
+
+    def conflicts(self, desk_id, starts_at, ends_at):
+        return self.desks[desk_id].conflicts(starts_at, ends_at)
+
+    def free_desks(self, starts_at, ends_at):
+        return [desk_id for desk_id in self.desk_ids if not self.desks[desk_id].conflicts(starts_at, ends_at)]
+
+
+def has_conflict(desk_id, starts_at, ends_at):
+    """Check whether a desk is already booked at any point in a period."""
+    return db.session.query(
+        select(Booking.id).where(Booking.desk_id == desk_id, overlaps(starts_at, ends_at)).exists()
+    ).scalar()
+
+
+def free_desks(organisation_id, starts_at, ends_at):
+    """Get the Desks in an organisation with no booking overlapping a period."""
+    booked = select(Booking.id).where(and_(Booking.desk_id == Desk.id, overlaps(starts_at, ends_at))).exists()
+    return Desk.query.filter(Desk.organisation_id == organisation_id, ~booked).order_by(Desk.name).all()
+
+
+def conflicting_periods(desk_id, periods):
+    """Return the subset of (starts_at, ends_at) periods that overlap an existing booking of a desk.
+
+    All periods are checked in a single query by joining a VALUES list against the booking index.
+    """
+    if not periods:
+        return set()
+    occurrence = values(
+        column("starts_at", DateTime(timezone=True)),
+        column("ends_at", DateTime(timezone=True)),
+        name="occurrence",
+    ).data(list(periods))
+    booked = (
+        select(Booking.id)
+        .where(Booking.desk_id == desk_id, overlaps(occurrence.c.starts_at, occurrence.c.ends_at))
+        .exists()
+    )
+    rows = db.session.execute(select(occurrence.c.starts_at, occurrence.c.ends_at).where(booked))
+    return {(starts_at, ends_at) for starts_at, ends_at in rows}
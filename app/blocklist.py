@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+from flask import current_app
+from wtforms.validators import ValidationError
+
+from app.domains import normalise, public_suffix
+
+
+def compile_entries(lines):
+    """Compile blocklist lines into a set of blocked domain suffixes and a set of blocked labels."""
+    suffixes = set()
+    labels = set()
+    for line in lines:
+        entry = normalise(line.split("#", 1)[0])
+        if not entry:
+            continue
+        if "." in entry:
+            suffixes.add(entry)
+        else:
+            labels.add(entry)
+    return frozenset(suffixes), frozenset(labels)
+
+
+class DomainBlocklist(object):
+    """Blocks personal and disposable email domains loaded from a file.
+
+    Lookups cost one set lookup per label in the domain, however many thousands of entries the list has. Entries
+    without a dot block the label directly in front of the domain's public suffix.
+    The file is loaded on the first lookup, then checked for changes at most every RELOAD_INTERVAL seconds and
+    reloaded without a restart. If BLOCKLIST_PATH can't be read before it has ever loaded, the bundled blocklist is
+    used until it can.
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.bundled_path = None
+        self.reload_interval = 30
+        self.entries = (frozenset(), frozenset())
+        self._mtime = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bundled_path = os.path.join(app.root_path, "blocklist.txt")
+        self.path = app.config.get("BLOCKLIST_PATH") or self.bundled_path
+        self.reload_interval = app.config.get("BLOCKLIST_RELOAD_INTERVAL", 30)
+        # Loaded on first use, so CLI commands such as "flask static build" don't read it
+        self._mtime = None
+        self._checked_at = float("-inf")
+        app.extensions["blocklist"] = self
+
+    def reload(self):
+        """Load the blocklist file if it has changed since it was last loaded."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            with open(self.path, encoding="UTF-8") as blocklist_file:
+                self.entries = compile_entries(blocklist_file)
+            self._mtime = mtime
+            return True
+
+    def load_bundled(self):
+        """Load the blocklist bundled with the app, in place of a blocklist file that can't be read."""
+        with open(self.bundled_path, encoding="UTF-8") as blocklist_file:
+            self.entries = compile_entries(blocklist_file)
+
+    def is_blocked(self, domain):
+        # A failed first load is retried at the same interval as reloads, not on every lookup
+        if self.path and time.monotonic() - self._checked_at > self.reload_interval:
+            loaded = self._mtime is not None
+            try:
+                if self.reload() and loaded:
+                    current_app.logger.info(f"Reloaded blocklist with {sum(map(len, self.entries))} entries")
+            except OSError as error:
+                if self._mtime is None and self.bundled_path and self.bundled_path != self.path:
+                    current_app.logger.error(f"Blocklist load failed, using the bundled blocklist: {error}")
+                    try:
+                        self.load_bundled()
+                    except OSError as bundled_error:
+                        current_app.logger.error(f"Bundled blocklist load failed: {bundled_error}")
+                else:
+                    current_app.logger.error(f"Blocklist reload failed, keeping previous entries: {error}")
+
+        # Both sets are swapped together, so a concurrent reload can't mix old and new entries
+        suffixes, labels = self.entries
+        parts = normalise(domain).split(".")
+        for i in range(len(parts)):
+            if ".".join(parts[i:]) in suffixes:
+                return True
+        # Labels only match the registrable label, so "outlook" blocks outlook.co.uk but not outlook.company.com
+        registrable = len(parts) - public_suffix(domain).count(".") - 2
+        return registrable >= 0 and parts[registrable] in labels
+
+
+class NotPersonalAddress(object):
+    """Validates that the domain of an email address field isn't on the blocklist."""
+
+    def __init__(self, message="Email address must not be a personal address."):
+        self.message = message
+
+    def __call__(self, form, field):
+        if field.errors or not field.data or "@" not in field.data:
+            return
+        if current_app.extensions["blocklist"].is_blocked(field.data.rsplit("@", 1)[1]):
+            raise ValidationError(self.message)
@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import redis
+from flask import current_app
+from sqlalchemy import DateTime, inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class TTLCache(object):
+    """Thread-safe in-process LRU cache where every entry expires after a fixed time to live."""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def values(self):
+        """A list of the values that haven't expired."""
+        now = time.monotonic()
+        with self._lock:
+            return [value for expires_at, value in self._data.values() if expires_at >= now]
+
+    def __len__(self):
+        return len(self._data)
+
+
+def snapshot(instance):
+    """Return the loaded column values of a model instance, excluding any named in its __cache_exclude__.
+
+    Deferred columns that weren't loaded are left out, rather than loaded one query at a time.
+    """
+    exclude = set(getattr(instance, "__cache_exclude__", ())) | inspect(instance).unloaded
+    return {
+        column.key: getattr(instance, column.key)
+        for column in instance.__mapper__.column_attrs
+        if column.key not in exclude
+    }
+
+
+def restore(model, values):
+    """Rebuild a detached model instance from a snapshot without emitting any SQL."""
+    instance = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    # Any columns missing from the snapshot are marked as expired and lazily loaded on access
+    make_transient_to_detached(instance)
+    return instance
+
+
+def dumps(values):
+    return json.dumps(values, default=lambda value: value.isoformat())
+
+
+def loads(model, data):
+    values = json.loads(data)
+    for column in model.__mapper__.column_attrs:
+        if isinstance(column.expression.type, DateTime) and values.get(column.key):
+            values[column.key] = datetime.fromisoformat(values[column.key])
+    return values
+
+
+class UserCache(object):
+    """Cache for the Flask-Login user loader, returning users with their organisation already attached.
+
+    Snapshots of users and organisations are held separately in an in-process LRU, and optionally in a
+    shared Redis tier, so that changing an organisation doesn't require finding every user in it.
+
+    Invalidation only reaches this process's LRU and Redis, so other processes can keep loading a user that
+    was just edited or deleted for up to USER_CACHE_TTL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.local = TTLCache()
+        self.redis = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.local = TTLCache(
+            maxsize=app.config.get("USER_CACHE_MAXSIZE", 1024),
+            ttl=app.config.get("USER_CACHE_TTL", 30),
+        )
+        self.ttl = app.config.get("USER_CACHE_REDIS_TTL", 300)
+        if app.config.get("USER_CACHE_REDIS_URL"):
+            self.redis = redis.Redis.from_url(app.config["USER_CACHE_REDIS_URL"], socket_timeout=0.1)
+        else:
+            self.redis = None
+        app.extensions["user_cache"] = self
+
+    def load_user(self, id):
+        """Get a User with a specific ID, attached to the current session along with its organisation."""
+        from app import db, organisation_deleter
+        from app.models import Organisation, User
+
+        user_values = self._get(User, f"user:{id}")
+        if user_values is None:
+            organisation = joinedload(User.organisation).options(*organisation_deleter.options())
+            user = User.query.options(organisation).get(id)
+            if user is None:
+                return None
+            self._set(f"user:{id}", snapshot(user))
+            if user.organisation is not None:
+                self._set(f"organisation:{user.organisation_id}", snapshot(user.organisation))
+            return user
+
+        user = restore(User, user_values)
+        organisation = None
+        if user.organisation_id:
+            organisation_values = self._get(Organisation, f"organisation:{user.organisation_id}")
+            if organisation_values is None:
+                organisation = Organisation.query.options(*organisation_deleter.options()).get(user.organisation_id)
+                if organisation is None:
+                    # Organisation has been deleted, taking its users with it
+                    self.invalidate_user(id)
+                    return None
+                self._set(f"organisation:{organisation.id}", snapshot(organisation))
+            else:
+                organisation = restore(Organisation, organisation_values)
+        set_committed_value(user, "organisation", organisation)
+        return db.session.merge(user, load=False)
+
+    def invalidate_user(self, id):
+        self._delete(f"user:{id}")
+
+    def invalidate_organisation(self, id):
+        self._delete(f"organisation:{id}")
+
+    def clear(self):
+        self.local.clear()
+
+    def _get(self, model, key):
+        values = self.local.get(key)
+        if values is not None or self.redis is None:
+            return values
+        try:
+            data = self.redis.get(key)
+        except redis.RedisError as error:
+            current_app.logger.warning(f"User cache read failed: {error}")
+            return None
+        if data is None:
+            return None
+        values = loads(model, data)
+        self.local.set(key, values)
+        return values
+
+    def _set(self, key, values):
+        self.local.set(key, values)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, dumps(values), ex=self.ttl)
+            except redis.RedisError as error:
+                current_app.logger.warning(f"User cache write failed: {error}")
+
+    def _delete(self, key):
+        self.local.delete(key)
+        if self.redis is not None:
+            try:
+                self.redis.delete(key)
+            except redis.RedisError as error:
+                current_app.logger.warning(f"User cache invalidation failed: {error}")
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+
+from app.fragments import key_part
+
+_releases = {}
+
+
+def release(app):
+    """Digest of the templates and static sources, so a deploy that changes any page changes every ETag."""
+    if app.name not in _releases:
+        digest = hashlib.sha256(app.config.get("RELEASE", "").encode("UTF-8"))
+        for folder in (os.path.join(app.root_path, "templates"), os.path.join(app.root_path, "static", "src")):
+            for root, _, files in sorted(os.walk(folder)):
+                for name in sorted(files):
+                    with open(os.path.join(root, name), "rb") as source:
+                        digest.update(source.read())
+        _releases[app.name] = digest.hexdigest()
+    return _releases[app.name]
+
+
+def user_parts():
+    """Everything about the current user that changes the shared page layout."""
+    if not current_user.is_authenticated:
+        return ["anonymous"]
+    return [current_user, current_user.login_at, current_user.role, current_user.organisation]
+
+
+def conditional(render, *parts):
+    """Return render() with an ETag, or a 304 without rendering if the client is up to date.
+
+    The ETag is built from the given model instances and values, the current user and the release. There is
+    no Last-Modified, as values such as counts have no timestamp to compare If-Modified-Since with.
+    Responses are only made conditional when nothing per request would be lost: requests with pending
+    flashed messages or without a cookie consent decision (which shows the cookie banner) always render,
+    and a page that turns out to contain a CSRF token is sent without validators.
+    """
+    if request.method not in ("GET", "HEAD") or session.get("_flashes") or "cookies_policy" not in request.cookies:
+        return render()
+
+    parts = [release(current_app), request.cookies["cookies_policy"], *user_parts(), *parts]
+    etag = hashlib.sha256("|".join(key_part(part) for part in parts).encode("UTF-8")).hexdigest()
+
+    if request.if_none_match:
+        # Flask-Compress appends the content coding to the ETag, e.g. "abc:br"
+        for tag in request.if_none_match.as_set():
+            if tag.split(":")[0] == etag:
+                return not_modified(tag)
+
+    response = make_response(render())
+    if "csrf_token" in g:
+        return response
+    response.set_etag(etag)
+    add_cache_headers(response)
+    return response
+
+
+def not_modified(etag):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    add_cache_headers(response)
+    return response
+
+
+def add_cache_headers(response):
+    # Pages are per user, so they must be revalidated and never stored by shared caches
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
@@ -0,0 +1,246 @@
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.orm import undefer
+
+organisations_cli = AppGroup("organisations", help="Manage organisations.")
+
+
+@organisations_cli.command("delete-pending")
+def delete_pending():
+    """Finish deleting organisations whose deletion was interrupted, such as by a dyno restart."""
+    from app import organisation_deleter
+    from app.models import Organisation
+
+    pending = [
+        organisation.id for organisation in Organisation.query.filter(Organisation.deletion_requested_at.isnot(None))
+    ]
+    for organisation_id in pending:
+        if organisation_deleter.run(organisation_id):
+            click.echo(f"Deleted organisation {organisation_id}")
+        else:
+            click.echo(f"Organisation {organisation_id} is being deleted by another process")
+
+
+# Seconds between checks of whether the database has the deletion_requested_at column yet
+SCHEMA_CHECK_INTERVAL = 60
+
+
+def lock_key(organisation_id):
+    return zlib.crc32(f"delete organisation {organisation_id}".encode("UTF-8"))
+
+
+class OrganisationDeleter(object):
+    """Deletes organisations in the background, committing DELETION_BATCH_SIZE rows at a time.
+
+    An organisation is marked for deletion straight away, which hides its domain from sign up. Its bookings,
+    desks and users are then deleted in short transactions, instead of one long cascade from the organisation
+    row, with a pause of DELETION_BATCH_PAUSE seconds between them. A Postgres advisory lock keeps each
+    organisation to one deleting thread across all processes, so an interrupted deletion is safely picked up
+    again by each process's sweep for pending deletions every DELETION_SWEEP_INTERVAL seconds, by viewing its
+    progress, or by "flask organisations delete-pending".
+
+    Organisation.deletion_requested_at is deferred and nothing reads it until ready() has found the column, as
+    instances that don't run the migration start serving this release against the previous schema.
+    """
+
+    def __init__(self, app=None):
+        self.batch_size = 1000
+        self.pause = 0.05
+        self.sweep_interval = 300
+        self.running = set()
+        self._sweeper_pid = None
+        self._ready = False
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.batch_size = app.config.get("DELETION_BATCH_SIZE", 1000)
+        self.pause = app.config.get("DELETION_BATCH_PAUSE", 0.05)
+        self.sweep_interval = app.config.get("DELETION_SWEEP_INTERVAL", 300)
+        self._ready = False
+        self._checked_at = float("-inf")
+        if self.sweep_interval:
+            app.before_request(self._start_sweeper)
+        app.cli.add_command(organisations_cli)
+        app.extensions["organisation_deleter"] = self
+
+    def ready(self):
+        """Whether the database has the deletion_requested_at column, checked every SCHEMA_CHECK_INTERVAL seconds."""
+        from app import db
+
+        if self._ready:
+            return True
+        now = time.monotonic()
+        if now - self._checked_at < SCHEMA_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        try:
+            columns = {column["name"] for column in inspect(db.engine).get_columns("organisation")}
+        except NoSuchTableError:
+            columns = set()
+        self._ready = "deletion_requested_at" in columns
+        return self._ready
+
+    def options(self):
+        """Query options for Organisation that load deletion_requested_at, once the column exists."""
+        from app.models import Organisation
+
+        return [undefer(Organisation.deletion_requested_at)] if self.ready() else []
+
+    def request(self, organisation):
+        """Mark an organisation for deletion and start deleting it in a background thread."""
+        from app import db, domains, member_search, user_cache
+        from app.timezones import utcnow
+
+        if organisation.deletion_requested_at is None:
+            organisation.deletion_requested_at = utcnow()
+            db.session.add(organisation)
+            db.session.commit()
+        user_cache.invalidate_organisation(organisation.id)
+        member_search.invalidate(organisation.id)
+        domains.clear()
+        self.start(organisation.id)
+
+    def start(self, organisation_id):
+        """Start deleting an organisation in a background thread, unless this process already is."""
+        with self._lock:
+            if organisation_id in self.running:
+                return
+            self.running.add(organisation_id)
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=self._run_in_thread, args=(app, organisation_id), name="organisation-deletion", daemon=True
+        ).start()
+
+    def sweep(self):
+        """Start deleting every organisation marked for deletion, returning their ids."""
+        from app import db
+        from app.models import Organisation
+
+        if not self.ready():
+            return []
+        pending = db.session.scalars(select(Organisation.id).where(Organisation.deletion_requested_at.isnot(None)))
+        pending = pending.all()
+        for organisation_id in pending:
+            self.start(organisation_id)
+        return pending
+
+    def progress(self, organisation_id):
+        """The number of bookings, desks and users an organisation has left to delete."""
+        from app import db
+        from app.models import Booking, Desk, User
+
+        return {
+            "bookings": db.session.scalar(
+                select(func.count(Booking.id)).join(Desk).where(Desk.organisation_id == organisation_id)
+            ),
+            "desks": db.session.scalar(select(func.count(Desk.id)).where(Desk.organisation_id == organisation_id)),
+            "users": db.session.scalar(select(func.count(User.id)).where(User.organisation_id == organisation_id)),
+        }
+
+    def run(self, organisation_id):
+        """Delete an organisation a batch at a time, returning False if another process is already deleting it."""
+        from app import db, domains, user_cache
+        from app.models import Booking, Desk, Organisation, User
+
+        with self.lock(organisation_id) as acquired:
+            if not acquired:
+                return False
+            start = time.perf_counter()
+            # Children first, so each batch only cascades to rows that have already gone
+            batches = [
+                (Booking, select(Booking.id).join(Desk).where(Desk.organisation_id == organisation_id)),
+                (Desk, select(Desk.id).where(Desk.organisation_id == organisation_id)),
+                (User, select(User.id).where(User.organisation_id == organisation_id)),
+            ]
+            deleted = 0
+            for model, ids in batches:
+                while True:
+                    statement = delete(model).where(model.id.in_(ids.limit(self.batch_size).scalar_subquery()))
+                    count = db.session.execute(statement, execution_options={"synchronize_session": False}).rowcount
+                    db.session.commit()
+                    deleted += count
+                    if count < self.batch_size:
+                        break
+                    time.sleep(self.pause)
+
+            db.session.execute(
+                delete(Organisation).where(Organisation.id == organisation_id),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+            user_cache.invalidate_organisation(organisation_id)
+            domains.clear()
+            elapsed = time.perf_counter() - start
+            current_app.logger.info(
+                f"Organisation {organisation_id} deleted with {deleted} rows in {elapsed:.1f} seconds"
+            )
+            return True
+
+    @contextmanager
+    def lock(self, organisation_id):
+        from app import db
+
+        if db.engine.dialect.name != "postgresql":
+            yield True
+            return
+        with db.engine.connect() as connection:
+            key = lock_key(organisation_id)
+            acquired = connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": key})
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+
+    def _run_in_thread(self, app, organisation_id):
+        from app import db
+
+        try:
+            with app.app_context():
+                try:
+                    self.run(organisation_id)
+                except Exception:
+                    app.logger.exception(f"Deleting organisation {organisation_id} failed")
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self.running.discard(organisation_id)
+
+    def _start_sweeper(self):
+        # Threads don't survive a fork, so each gunicorn worker starts its own sweep on its first request
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=self._sweep_in_thread, args=(app,), name="organisation-deletion-sweep", daemon=True
+        ).start()
+
+    def _sweep_in_thread(self, app):
+        from app import db
+
+        while True:
+            with app.app_context():
+                try:
+                    self.sweep()
+                except Exception:
+                    app.logger.exception("Sweeping organisations pending deletion failed")
+                finally:
+                    db.session.remove()
+            time.sleep(self.sweep_interval)
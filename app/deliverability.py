@@ -0,0 +1,68 @@
+from email_validator import EmailUndeliverableError, validate_email_deliverability
+from flask import current_app
+from wtforms.validators import ValidationError
+
+from app.cache import TTLCache
+
+
+class DeliverabilityChecker(object):
+    """Checks that an email domain accepts mail, caching the DNS answer per domain.
+
+    Deliverable domains are remembered for POSITIVE_TTL seconds and undeliverable ones, along with the
+    reason, for NEGATIVE_TTL seconds. Timeouts aren't cached, and don't fail validation.
+    """
+
+    def __init__(self, app=None):
+        self.resolver = None
+        self.timeout = 5
+        self.positive = TTLCache()
+        self.negative = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.resolver = app.config.get("EMAIL_DNS_RESOLVER")
+        self.timeout = app.config.get("EMAIL_DNS_TIMEOUT", 5)
+        maxsize = app.config.get("EMAIL_DELIVERABILITY_CACHE_MAXSIZE", 4096)
+        self.positive = TTLCache(maxsize=maxsize, ttl=app.config.get("EMAIL_DELIVERABILITY_POSITIVE_TTL", 3600))
+        self.negative = TTLCache(maxsize=maxsize, ttl=app.config.get("EMAIL_DELIVERABILITY_NEGATIVE_TTL", 300))
+        app.extensions["deliverability"] = self
+
+    def check(self, domain):
+        """Raise EmailUndeliverableError if the domain can't receive email."""
+        domain = domain.lower().strip().rstrip(".")
+        if self.positive.get(domain):
+            return
+        reason = self.negative.get(domain)
+        if reason is not None:
+            raise EmailUndeliverableError(reason)
+
+        try:
+            result = validate_email_deliverability(domain, domain, timeout=self.timeout, dns_resolver=self.resolver)
+        except EmailUndeliverableError as error:
+            self.negative.set(domain, str(error))
+            raise
+        if "unknown-deliverability" in result:
+            current_app.logger.warning(f"Email deliverability check for {domain} timed out")
+        else:
+            self.positive.set(domain, True)
+
+    def clear(self):
+        self.positive.clear()
+        self.negative.clear()
+
+
+class Deliverable(object):
+    """Validates that the domain of an email address field accepts mail, using the cached checker.
+
+    Use alongside Email(check_deliverability=False), which handles the syntax check.
+    """
+
+    def __call__(self, form, field):
+        # Skip addresses that have already failed the syntax check
+        if field.errors or not field.data or "@" not in field.data:
+            return
+        try:
+            current_app.extensions["deliverability"].check(field.data.rsplit("@", 1)[1])
+        except EmailUndeliverableError as error:
+            raise ValidationError(str(error)) from error
@@ -0,0 +1,132 @@
+import functools
+import os
+
+from app.cache import TTLCache, restore, snapshot
+
+PUBLIC_SUFFIX_LIST_PATH = os.path.join(os.path.dirname(__file__), "public_suffix_list.dat")
+
+
+def normalise(domain):
+    return domain.lower().strip().rstrip(".")
+
+
+def compile_rules(lines):
+    """Compile public suffix list lines into sets of rules, wildcard rules and exception rules.
+
+    Wildcard rules such as *.ck are kept as their parent, ck, and exception rules such as !www.ck without the !.
+    Internationalised rules are added in both their Unicode and punycode forms.
+    """
+    rules, wildcards, exceptions = set(), set(), set()
+    for line in lines:
+        rule = line.split("//", 1)[0].strip().lower()
+        if not rule:
+            continue
+        if rule.startswith("!"):
+            target, rule = exceptions, rule[1:]
+        elif rule.startswith("*."):
+            target, rule = wildcards, rule[2:]
+        else:
+            target = rules
+        target.add(rule)
+        try:
+            target.add(rule.encode("idna").decode("ascii"))
+        except UnicodeError:
+            pass
+    return frozenset(rules), frozenset(wildcards), frozenset(exceptions)
+
+
+@functools.lru_cache(maxsize=None)
+def public_suffix_rules():
+    with open(PUBLIC_SUFFIX_LIST_PATH, encoding="UTF-8") as public_suffix_file:
+        return compile_rules(public_suffix_file)
+
+
+def public_suffix(domain):
+    """The public suffix a domain is registered under, e.g. co.uk for bbc.co.uk, from the Public Suffix List.
+
+    The longest matching rule wins, exception rules beat wildcard rules, and a domain matching no rule is under
+    its top level domain.
+    """
+    rules, wildcards, exceptions = public_suffix_rules()
+    labels = normalise(domain).split(".")
+    for i in range(len(labels)):
+        suffix = ".".join(labels[i:])
+        if suffix in exceptions:
+            return ".".join(labels[i + 1 :])
+        if suffix in rules or ".".join(labels[i + 1 :]) in wildcards:
+            return suffix
+    return labels[-1]
+
+
+def is_public_suffix(domain):
+    return normalise(domain) == public_suffix(domain)
+
+
+def candidates(domain, subdomains=True):
+    """Return the domain followed by each parent domain, e.g. uk.bbc.co.uk, bbc.co.uk.
+
+    Parents stop at the registrable domain, so public suffixes such as co.uk are never candidates.
+    """
+    domain = normalise(domain)
+    if not subdomains:
+        return [domain]
+    labels = domain.split(".")
+    suffix_labels = public_suffix(domain).count(".") + 1
+    return [".".join(labels[i:]) for i in range(max(len(labels) - suffix_labels, 1))]
+
+
+class DomainResolver(object):
+    """Resolves an email or organisation domain to the Organisation that owns it.
+
+    A subdomain resolves to the organisation owning its closest parent domain, found with a single query
+    against the unique organisation domain index. Results, including misses, are cached per normalised
+    domain and the whole cache is cleared whenever an organisation is created, edited or deleted. Only the
+    process making a change clears its cache, so other processes can resolve a deleted organisation for up to
+    DOMAIN_CACHE_TTL seconds; pass fresh=True before writing a reference to the organisation.
+    """
+
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = TTLCache(
+            maxsize=app.config.get("DOMAIN_CACHE_MAXSIZE", 4096),
+            ttl=app.config.get("DOMAIN_CACHE_TTL", 60),
+        )
+        app.extensions["domains"] = self
+
+    def resolve(self, domain, subdomains=True, pending=False, fresh=False):
+        """Get the Organisation for a domain, or None if no organisation owns it.
+
+        Organisations being deleted only own their domain when pending is True. With fresh, the database is
+        always queried and the cache updated.
+        """
+        from app import db, organisation_deleter
+        from app.models import Organisation
+
+        key = (normalise(domain), subdomains, pending)
+        values = None if fresh else self.cache.get(key)
+        if values is None:
+            names = candidates(domain, subdomains)
+            query = Organisation.query.filter(Organisation.domain.in_(names))
+            if not pending and organisation_deleter.ready():
+                query = query.filter(Organisation.deletion_requested_at.is_(None))
+            organisations = query.all()
+            if not organisations:
+                self.cache.set(key, False)
+                return None
+            # Prefer the most specific match, e.g. uk.example.com over example.com
+            organisation = min(organisations, key=lambda organisation: names.index(organisation.domain))
+            self.cache.set(key, snapshot(organisation))
+            return organisation
+        if values is False:
+            return None
+        return db.session.merge(restore(Organisation, values), load=False)
+
+    def resolve_email(self, email_address, fresh=False):
+        return self.resolve(email_address.rsplit("@", 1)[1], fresh=fresh)
+
+    def clear(self):
+        self.cache.clear()
@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+
+import redis
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.cache import TTLCache
+
+
+def key_part(value):
+    """Key a model instance on its table, id and last change, and anything else on its repr."""
+    if hasattr(value, "__table__"):
+        changed_at = getattr(value, "updated_at", None) or getattr(value, "created_at", None)
+        return f"{value.__table__.name}:{value.id}:{changed_at.isoformat() if changed_at else ''}"
+    return repr(value)
+
+
+def make_key(parts):
+    return "fragment:" + hashlib.sha256("|".join(key_part(part) for part in parts).encode("UTF-8")).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds a {% cache %} tag that caches the rendered body keyed on the values given to it, e.g.
+
+    {% cache user, user.login_at %}...{% endcache %}
+
+    Model instances are keyed on their id and updated_at, so a fragment is re-rendered as soon as the row
+    changes. The body must not contain anything per request, such as CSRF tokens or flashed messages.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [nodes.Const(parser.name), nodes.Const(lineno), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        fragment_cache = self.environment.fragment_cache
+        if fragment_cache is None or not fragment_cache.enabled:
+            return caller()
+        return fragment_cache.fetch(make_key(parts), caller)
+
+
+class FragmentCache(object):
+    """Cache of rendered template fragments in an in-process LRU, with an optional shared Redis tier."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.local = TTLCache()
+        self.redis = None
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("FRAGMENT_CACHE_ENABLED", True)
+        self.ttl = app.config.get("FRAGMENT_CACHE_TTL", 300)
+        self.local = TTLCache(maxsize=app.config.get("FRAGMENT_CACHE_MAXSIZE", 2048), ttl=self.ttl)
+        if app.config.get("FRAGMENT_CACHE_REDIS_URL"):
+            self.redis = redis.Redis.from_url(app.config["FRAGMENT_CACHE_REDIS_URL"], socket_timeout=0.1)
+        else:
+            self.redis = None
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.extensions["fragment_cache"] = self
+
+    def fetch(self, key, render):
+        fragment = self._get(key)
+        if fragment is not None:
+            self._count(hit=True)
+            return fragment
+
+        start = time.perf_counter()
+        fragment = render()
+        self._count(hit=False, seconds=time.perf_counter() - start)
+        self._set(key, fragment)
+        return fragment
+
+    def stats(self):
+        """Hit and miss counts, with the render time saved estimated from the average miss."""
+        with self._lock:
+            average = self.render_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+                "render_seconds": self.render_seconds,
+                "saved_seconds": self.hits * average,
+            }
+
+    def clear(self):
+        self.local.clear()
+
+    def _count(self, hit, seconds=0.0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.render_seconds += seconds
+
+    def _get(self, key):
+        fragment = self.local.get(key)
+        if fragment is not None or self.redis is None:
+            return fragment
+        try:
+            data = self.redis.get(key)
+        except redis.RedisError as error:
+            current_app.logger.warning(f"Fragment cache read failed: {error}")
+            return None
+        if data is None:
+            return None
+        fragment = Markup(data.decode("UTF-8"))
+        self.local.set(key, fragment)
+        return fragment
+
+    def _set(self, key, fragment):
+        self.local.set(key, fragment)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, str(fragment).encode("UTF-8"), ex=self.ttl)
+            except redis.RedisError as error:
+                current_app.logger.warning(f"Fragment cache write failed: {error}")
@@ -0,0 +1,235 @@
+import codecs
+import csv
+import io
+import itertools
+import json
+import secrets
+import time
+import uuid
+
+from email_validator import EmailNotValidError, EmailUndeliverableError, validate_email
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.timezones import NAMES, utcnow
+
+REPORT_FIELDS = ("line", "email_address", "status", "message", "initial_password")
+ROLES = ("user", "admin")
+
+
+class RowError(ValueError):
+    pass
+
+
+def decode_lines(stream, invalid):
+    """Decode a binary upload a line at a time as UTF-8, adding the numbers of lines that aren't to invalid."""
+    for number, line in enumerate(stream, start=1):
+        if number == 1 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8) :]
+        try:
+            yield line.decode("UTF-8")
+        except UnicodeDecodeError:
+            invalid.add(number)
+            yield line.decode("UTF-8", errors="replace")
+
+
+def read_rows(stream, format="csv"):
+    """Yield (line number, row) from a binary CSV or JSON lines upload, reading a line at a time.
+
+    Rows that can't be parsed, or that aren't UTF-8, are yielded as None rather than ending the upload.
+    """
+    invalid = set()
+    lines = decode_lines(stream, invalid)
+    return read_csv(lines, invalid) if format == "csv" else read_json_lines(lines, invalid)
+
+
+def read_csv(lines, invalid):
+    reader = csv.DictReader(lines)
+    previous = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            # Such as a NUL byte, after which the reader carries on from the next line
+            row = None
+        # A quoted field can span several lines, any of which may not have decoded
+        if invalid.intersection(range(previous + 1, reader.line_num + 1)):
+            row = None
+        previous = reader.line_num
+        yield reader.line_num, row
+
+
+def read_json_lines(lines, invalid):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) and number not in invalid else None
+
+
+def field(row, name):
+    value = row.get(name)
+    return str(value).strip() if value is not None else ""
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(rows):
+    """Encode report rows as CSV a line at a time, for a streamed response."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class UserImport(object):
+    """Imports users into an organisation in chunks, yielding a report row for every line of the upload.
+
+    Each chunk is validated, has its passwords hashed on the password hashing pool and is inserted in one
+    statement, skipping email addresses that already have an account. Rows without a password get a random
+    initial password, which is included in the report.
+    """
+
+    def __init__(self, organisation_id, timezone="UTC", chunk_size=500):
+        self.organisation_id = organisation_id
+        self.timezone = timezone
+        self.chunk_size = chunk_size
+        self.seen = set()
+        self.counts = {"imported": 0, "skipped": 0, "error": 0}
+        self._organisations = {}
+
+    def run(self, rows):
+        yield REPORT_FIELDS
+        start = time.perf_counter()
+        for chunk in chunks(rows, self.chunk_size):
+            yield from self.import_chunk(chunk)
+
+        elapsed = time.perf_counter() - start
+        rate = self.counts["imported"] / elapsed if elapsed else 0.0
+        summary = (
+            f"{self.counts['imported']} imported, {self.counts['skipped']} already had accounts and "
+            f"{self.counts['error']} had errors in {elapsed:.1f} seconds ({rate:.0f} users per second)"
+        )
+        current_app.logger.info(f"Organisation {self.organisation_id} user import: {summary}")
+        yield ("", "", "summary", summary, "")
+
+    def import_chunk(self, chunk):
+        from app import db, member_search, password_hasher
+        from app.models import User
+
+        report, valid = {}, []
+        for number, row in chunk:
+            try:
+                valid.append((number, self.validate(row)))
+            except RowError as error:
+                email_address = field(row or {}, "email_address")
+                report[number] = (number, email_address, "error", str(error), "")
+                self.counts["error"] += 1
+
+        if valid:
+            passwords = [user.pop("password") for _, user in valid]
+            hashes = password_hasher.hash_many([password for password, _ in passwords])
+            for (_, user), hashed_password in zip(valid, hashes):
+                user["password"] = hashed_password
+
+            users = [user for _, user in valid]
+            statement = insert(User.__table__).values(users).on_conflict_do_nothing(index_elements=["email_address"])
+            if db.engine.dialect.name == "postgresql":
+                inserted = set(db.session.execute(statement.returning(User.__table__.c.id)).scalars())
+            else:
+                # Without RETURNING, find the inserted rows by their new ids
+                db.session.execute(statement)
+                ids = [user["id"] for user in users]
+                inserted = set(db.session.execute(select(User.__table__.c.id).where(User.id.in_(ids))).scalars())
+            db.session.commit()
+            member_search.invalidate(self.organisation_id)
+
+            for (number, user), (_, generated) in zip(valid, passwords):
+                if user["id"] in inserted:
+                    report[number] = (number, user["email_address"], "imported", "", generated or "")
+                    self.counts["imported"] += 1
+                else:
+                    report[number] = (
+                        number,
+                        user["email_address"],
+                        "skipped",
+                        "Email address already has an account",
+                        "",
+                    )
+                    self.counts["skipped"] += 1
+
+        for number in sorted(report):
+            yield report[number]
+
+    def validate(self, row):
+        """Return the values to insert for a row, with password as (password, generated password or None)."""
+        if row is None:
+            raise RowError("Row could not be read")
+
+        name = field(row, "name")
+        if not name:
+            raise RowError("Enter a name")
+
+        try:
+            email_address = validate_email(field(row, "email_address"), check_deliverability=False).email.lower()
+        except EmailNotValidError as error:
+            raise RowError(str(error)) from error
+        if email_address in self.seen:
+            raise RowError("Email address appears more than once")
+        domain = email_address.rsplit("@", 1)[1]
+        if self.organisation_for(domain) != self.organisation_id:
+            raise RowError("Email address must be in one of your organisation's domains")
+
+        timezone = field(row, "timezone") or self.timezone
+        if timezone not in NAMES:
+            raise RowError(f"{timezone} is not a recognised timezone")
+
+        role = field(row, "role").lower() or "user"
+        if role not in ROLES:
+            raise RowError("Role must be user or admin")
+
+        password = str(row.get("password") or "")
+        if password and not 8 <= len(password) <= 72:
+            raise RowError("Password must be between 8 and 72 characters")
+
+        self.seen.add(email_address)
+        return {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "email_address": email_address,
+            "password": (password, None) if password else (secrets.token_urlsafe(12),) * 2,
+            "timezone": timezone,
+            "organisation_id": self.organisation_id,
+            "role": role,
+            "created_at": utcnow(),
+        }
+
+    def organisation_for(self, domain):
+        """The id of the organisation a domain belongs to, checking its deliverability once per import."""
+        if domain not in self._organisations:
+            from app import deliverability, domains
+
+            organisation = domains.resolve(domain, fresh=True)
+            if organisation is not None:
+                try:
+                    deliverability.check(domain)
+                except EmailUndeliverableError as error:
+                    raise RowError(str(error)) from error
+            self._organisations[domain] = organisation.id if organisation is not None else None
+        return self._organisations[domain]
@@ -0,0 +1,173 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+import pytz
+from flask import current_app, g, has_request_context, request
+
+# Record attributes that are added to the JSON output when they are set
+FIELDS = ("request_id", "method", "path", "endpoint", "user_id", "status", "duration_ms")
+# Request ids from clients are only trusted if they look like ones from Heroku's router or this app
+REQUEST_ID = re.compile(r"[A-Za-z0-9-]{1,200}")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, pytz.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({field: getattr(record, field) for field in FIELDS if getattr(record, field, None) is not None})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request's id, endpoint and user to records logged while handling it."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(record, "request_id", None) or g.get("request_id")
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            # Only use a user that has already been loaded, as loading one here could log in turn
+            user = g.get("_login_user")
+            if user is not None and user.is_authenticated:
+                record.user_id = user.get_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO and lower records marked with sample=True, and every other record."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, "sample", False) or record.levelno >= logging.WARNING:
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues records for a listener thread to write, dropping them rather than blocking when the queue is full.
+
+    The listener is started on first use in each process, so it survives gunicorn forking workers.
+    """
+
+    def __init__(self, handler, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.handler = handler
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def prepare(self, record):
+        # Format the message and traceback now, as the arguments may change before the listener writes it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # A listener inherited from a parent process has no thread left to stop
+            self.listener = QueueListener(self.queue, self.handler, respect_handler_level=True)
+            self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+
+
+class RequestLogging(object):
+    """Writes app logs as JSON lines through a bounded queue, with one sampled log line per request."""
+
+    def __init__(self, app=None):
+        self.handler = None
+        # Registered once, however many apps are created, and stops whichever handler is current at exit
+        atexit.register(self.stop)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JSONFormatter())
+        if self.handler is not None:
+            self.handler.stop()
+        self.handler = DroppingQueueHandler(stream_handler, maxsize=app.config.get("LOG_QUEUE_SIZE", 10000))
+        self.handler.addFilter(SamplingFilter(app.config.get("LOG_SAMPLE_RATE", 1.0)))
+        self.handler.addFilter(RequestContextFilter())
+        self.handler.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+
+        app.logger.handlers = [self.handler]
+        app.logger.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions["request_logging"] = self
+
+    def stop(self):
+        if self.handler is not None:
+            self.handler.stop()
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler is not None else 0
+
+    def _before_request(self):
+        # Heroku's router sets X-Request-ID, so log lines can be matched with its own
+        request_id = request.headers.get("X-Request-ID", "")
+        g.request_id = request_id if REQUEST_ID.fullmatch(request_id) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        # Another before_request function may have returned a response before this one ran
+        if "request_id" not in g:
+            return response
+        response.headers["X-Request-ID"] = g.request_id
+        duration_ms = round((time.perf_counter() - g.request_started) * 1000, 1)
+        level = logging.ERROR if response.status_code >= 500 else logging.INFO
+        current_app.logger.log(
+            level,
+            f"{request.method} {request.path} {response.status_code}",
+            extra={"sample": True, "status": response.status_code, "duration_ms": duration_ms},
+        )
+        return response
@@ -2,13 +2,14 @@ from flask import current_app, flash, json, make_response, redirect, render_temp
 from flask_wtf.csrf import CSRFError
 from werkzeug.exceptions import HTTPException
 
+from app.conditional import conditional
 from app.main import bp
 from app.main.forms import CookiesForm
 
 
 @bp.route("/", methods=["GET"])
 def index():
-    return render_template("main/index.html")
+    return conditional(lambda: render_template("main/index.html"))
 
 
 @bp.route("/cookies", methods=["GET", "POST"])
@@ -46,13 +47,20 @@ def cookies():
 
 @bp.route("/privacy", methods=["GET"])
 def privacy():
-    return render_template("privacy.html", title="Privacy notice")
+    return conditional(lambda: render_template("privacy.html", title="Privacy notice"))
+
+
+@bp.route("/accessibility", methods=["GET"])
+def accessibility():
+    return conditional(lambda: render_template("accessibility.html", title="Accessibility statement"))
 
 
 @bp.app_errorhandler(HTTPException)
 def http_exception(error):
     current_app.logger.error(f"{error.code}: {error.name} - {request.url}")
-    return render_template("error.html", title=error.name, error=error), error.code
+    # Keep headers such as Retry-After and Allow, leaving the content type to the rendered page
+    headers = [(name, value) for name, value in error.get_headers() if name != "Content-Type"]
+    return render_template("error.html", title=error.name, error=error), error.code, headers
 
 
 @bp.app_errorhandler(CSRFError)
@@ -0,0 +1,85 @@
+import base64
+import json
+import uuid
+
+from sqlalchemy import select, tuple_
+
+EXPORT_FIELDS = ("id", "name", "email_address", "role", "timezone", "created_at", "login_at")
+
+
+def columns():
+    from app.models import User
+
+    # Only the columns shown or exported, leaving out the password hash
+    return [getattr(User, field) for field in EXPORT_FIELDS]
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row.name, row.id]).encode("UTF-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The (name, id) a cursor points after, or None if it isn't a valid cursor."""
+    try:
+        name, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(name, str) or not isinstance(id, str):
+        return None
+    try:
+        # Checked here, as Postgres rejects a malformed UUID with an error rather than no rows
+        id = str(uuid.UUID(id))
+    except ValueError:
+        return None
+    return name, id
+
+
+def page(organisation_id, after=None, size=50):
+    """A page of an organisation's members ordered by name, and a cursor for the next page or None.
+
+    Pages are found with a keyset on (name, id) instead of an offset, read from the (organisation_id, name, id)
+    index, so every page costs the same to fetch.
+    """
+    from app import db
+    from app.models import User
+
+    query = select(*columns()).where(User.organisation_id == organisation_id)
+    if after is not None:
+        query = query.where(tuple_(User.name, User.id) > tuple_(*after))
+    # Fetch one more row than the page holds to find out if there is a next page
+    rows = db.session.execute(query.order_by(User.name, User.id).limit(size + 1)).all()
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def iter_members(organisation_id, batch_size=1000):
+    """Yield all of an organisation's members in pages of batch_size, holding one page in memory at a time."""
+    after = None
+    while True:
+        rows, cursor = page(organisation_id, after, batch_size)
+        yield from rows
+        if cursor is None:
+            return
+        after = rows[-1].name, rows[-1].id
+
+
+def value(row, field):
+    value = getattr(row, field)
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def export_rows(rows):
+    """Report rows for write_csv, starting with a header."""
+    yield EXPORT_FIELDS
+    for row in rows:
+        yield tuple("" if value(row, field) is None else value(row, field) for field in EXPORT_FIELDS)
+
+
+def write_json(rows):
+    """Encode rows as a JSON array an element at a time, for a streamed response."""
+    separator = "[\n"
+    for row in rows:
+        yield separator + json.dumps({field: value(row, field) for field in EXPORT_FIELDS})
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
@@ -0,0 +1,272 @@
+import collections
+import hmac
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def add_request_time(name, seconds):
+    """Add to a per request total, such as time spent hashing passwords, when called during a request."""
+    if has_request_context():
+        g.setdefault("metrics_totals", collections.Counter())[name] += seconds
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_text(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class Histogram(object):
+    """Cumulative bucket counts, count and sum per combination of label values, in Prometheus' model."""
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            buckets, count, total = self.values.get(labels, ([0] * len(self.buckets), 0, 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[index] += 1
+            self.values[labels] = (buckets, count + 1, total + value)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted(
+                (labels, (list(buckets), count, total)) for labels, (buckets, count, total) in self.values.items()
+            )
+        for labels, (buckets, count, total) in values:
+            for bound, bucket in zip(self.buckets, buckets):
+                lines.append(f"{self.name}_bucket{label_text(self.labels, labels, le=bound)} {bucket}")
+            lines.append(f"{self.name}_bucket{label_text(self.labels, labels, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{label_text(self.labels, labels)} {count}")
+        return lines
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            metrics = current_app.extensions.get("metrics") if has_request_context() else None
+            if metrics is not None:
+                metrics.template_seconds.observe(seconds, self.name or "string")
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    add_request_time("db", seconds)
+    if has_request_context():
+        g.metrics_queries = g.get("metrics_queries", 0) + 1
+
+
+def handle_error(context):
+    # A failed statement never reaches after_cursor_execute, so drop its start time from the pooled connection
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+class SamplingProfiler(object):
+    """Samples the stacks of threads handling requests and writes them in collapsed stack format.
+
+    Each line of a profile is a ;-separated stack, root first, and the number of samples it was seen in,
+    ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.active = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, ident):
+        with self._lock:
+            self.active[ident] = collections.Counter()
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="profiler", daemon=True).start()
+
+    def stop(self, ident):
+        with self._lock:
+            return self.active.pop(ident, collections.Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+
+
+def collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Metrics(object):
+    """Request latency, SQL and render time histograms per endpoint, exposed in Prometheus format at /metrics.
+
+    The endpoint needs METRICS_TOKEN as a bearer token and is not registered without one. With
+    PROFILE_SLOW_REQUEST_MS set, requests are sampled and the stacks of slower ones written to PROFILE_DIR.
+    """
+
+    def __init__(self, app=None):
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "Time to handle a request.", ("endpoint", "method", "status")
+        )
+        self.query_count = Histogram(
+            "http_request_sql_queries", "SQL queries per request.", ("endpoint",), buckets=QUERY_BUCKETS
+        )
+        self.db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL queries per request.", ("endpoint",))
+        self.hash_seconds = Histogram(
+            "http_request_password_hash_seconds", "Time spent hashing passwords per request.", ("endpoint",)
+        )
+        self.template_seconds = Histogram("template_render_seconds", "Time to render a template.", ("template",))
+        self.profiler = None
+        self.profile_threshold = None
+        self.profile_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+            event.listen(Engine, "handle_error", handle_error)
+        app.jinja_env.template_class = TimedTemplate
+
+        if app.config.get("PROFILE_SLOW_REQUEST_MS"):
+            self.profile_threshold = app.config["PROFILE_SLOW_REQUEST_MS"] / 1000
+            self.profile_dir = app.config.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "profiles")
+            self.profiler = SamplingProfiler(app.config.get("PROFILE_INTERVAL_MS", 5) / 1000)
+        else:
+            self.profiler = None
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if app.config.get("METRICS_TOKEN"):
+            app.add_url_rule("/metrics", "metrics", self.view)
+        app.extensions["metrics"] = self
+
+    def view(self):
+        authorization = request.headers.get("Authorization", "").encode("UTF-8")
+        if not hmac.compare_digest(authorization, f"Bearer {current_app.config['METRICS_TOKEN']}".encode("UTF-8")):
+            abort(404)
+        return Response("\n".join(self.expose()) + "\n", mimetype="text/plain; version=0.0.4")
+
+    def expose(self):
+        lines = []
+        for histogram in (
+            self.request_seconds,
+            self.query_count,
+            self.db_seconds,
+            self.hash_seconds,
+            self.template_seconds,
+        ):
+            lines.extend(histogram.expose())
+        for name, value in self.gauges().items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        login_admission = current_app.extensions.get("login_admission")
+        if login_admission is not None:
+            lines.append(
+                "# HELP login_attempts_total Log in attempts accepted for a password check or shed with a 429."
+            )
+            lines.append("# TYPE login_attempts_total counter")
+            for outcome, count in sorted(login_admission.counts.items()):
+                lines.append(f"login_attempts_total{label_text(('outcome',), (outcome,))} {count}")
+        return lines
+
+    def gauges(self):
+        gauges = {}
+        fragment_cache = current_app.extensions.get("fragment_cache")
+        if fragment_cache is not None:
+            for name, value in fragment_cache.stats().items():
+                gauges[f"fragment_cache_{name}"] = value
+        database_pool = current_app.extensions.get("database_pool")
+        if database_pool is not None:
+            for name, value in database_pool.stats(current_app).items():
+                gauges[f"db_pool_{name}"] = value
+        request_logging = current_app.extensions.get("request_logging")
+        if request_logging is not None:
+            gauges["log_records_dropped"] = request_logging.dropped
+        login_admission = current_app.extensions.get("login_admission")
+        if login_admission is not None:
+            gauges["login_password_checks_in_flight"] = login_admission.in_flight
+        return gauges
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start(threading.get_ident())
+
+    def _after_request(self, response):
+        if "metrics_started" not in g:
+            return response
+        seconds = time.perf_counter() - g.metrics_started
+        endpoint = request.endpoint or "unmatched"
+        totals = g.get("metrics_totals", collections.Counter())
+        self.request_seconds.observe(seconds, endpoint, request.method, str(response.status_code))
+        self.query_count.observe(g.get("metrics_queries", 0), endpoint)
+        self.db_seconds.observe(totals["db"], endpoint)
+        if totals["password_hash"]:
+            self.hash_seconds.observe(totals["password_hash"], endpoint)
+
+        if self.profiler is not None:
+            stacks = self.profiler.stop(threading.get_ident())
+            if seconds >= self.profile_threshold and stacks:
+                self._write_profile(endpoint, seconds, stacks)
+        return response
+
+    def _teardown_request(self, exception):
+        # Requests that raise may skip after_request, so stop sampling their thread here
+        if self.profiler is not None:
+            self.profiler.stop(threading.get_ident())
+
+    def _write_profile(self, endpoint, seconds, stacks):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{int(time.time())}-{endpoint}-{g.get('request_id', os.getpid())}.folded"
+        path = os.path.join(self.profile_dir, name)
+        with open(path, "w") as profile:
+            for stack, count in stacks.most_common():
+                profile.write(f"{stack} {count}\n")
+        current_app.logger.warning(f"Slow request to {endpoint} took {seconds * 1000:.0f}ms, profile written to {path}")
@@ -1,16 +1,35 @@
 import uuid
-from datetime import datetime
+from collections import namedtuple
+from datetime import timedelta
 
-import bcrypt
-import pytz
 from flask_login import UserMixin
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import UUID, ExcludeConstraint
 
-from app import db, login
+from app import db, login, password_hasher, user_cache
+from app.timezones import utcnow
 
 
 class User(UserMixin, db.Model):
     __tablename__ = "user_account"
+    __cache_exclude__ = ("password",)
+    __table_args__ = (
+        # Keyset pagination of the member directory
+        db.Index("ix_user_account_organisation_id_name_id", "organisation_id", "name", "id"),
+        # Prefix search within an organisation, and trigram indexes for substring and fuzzy search
+        db.Index(
+            "ix_user_account_organisation_id_name_prefix", "organisation_id", db.text('lower(name) COLLATE "C"'), "id"
+        ),
+        db.Index(
+            "ix_user_account_organisation_id_email_address_prefix",
+            "organisation_id",
+            db.text('lower(email_address) COLLATE "C"'),
+        ),
+        db.Index("ix_user_account_name_trgm", db.text("lower(name) gin_trgm_ops"), postgresql_using="gin"),
+        db.Index(
+            "ix_user_account_email_address_trgm", db.text("lower(email_address) gin_trgm_ops"), postgresql_using="gin"
+        ),
+    )
 
     # Fields
     id = db.Column(UUID, primary_key=True)
@@ -29,6 +48,9 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
     login_at = db.Column(db.DateTime(timezone=True), nullable=True)
 
+    # Relationships
+    bookings = db.relationship("Booking", backref="user", lazy=True, passive_deletes=True)
+
     # Methods
     def __init__(self, name, email_address, password, timezone, role):
         self.id = str(uuid.uuid4())
@@ -36,19 +58,25 @@ class User(UserMixin, db.Model):
         self.email_address = email_address.lower().strip()
         self.timezone = timezone
         self.role = role
-        self.created_at = pytz.utc.localize(datetime.utcnow())
+        self.created_at = utcnow()
         self.set_password(password)
 
     def set_password(self, password):
-        self.password = bcrypt.hashpw(password.encode("UTF-8"), bcrypt.gensalt())
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode("UTF-8"), self.password)
+        return password_hasher.check(password, self.password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password)
+
+
+OrganisationStatistics = namedtuple("OrganisationStatistics", ["users", "admins", "recent_logins", "recent_days"])
 
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(id)
+    return user_cache.load_user(id)
 
 
 class Organisation(db.Model):
@@ -58,13 +86,95 @@ class Organisation(db.Model):
     domain = db.Column(db.String(255), nullable=False, unique=True, index=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    # Deferred, so instances serving this release against the previous schema don't select it. Only read it once
+    # organisation_deleter.ready() has found the column
+    deletion_requested_at = db.deferred(db.Column(db.DateTime(timezone=True), nullable=True))
 
     # Relationships
     users = db.relationship("User", backref="organisation", lazy=True, passive_deletes=True)
+    desks = db.relationship("Desk", backref="organisation", lazy=True, passive_deletes=True)
 
     # Methods
     def __init__(self, name, domain):
         self.id = str(uuid.uuid4())
         self.name = name.strip()
         self.domain = domain.lower().strip()
-        self.created_at = pytz.utc.localize(datetime.utcnow())
+        self.created_at = utcnow()
+
+    def statistics(self, recent_days=30):
+        """Count users, admins and recent log ins in one aggregate query, without loading any users."""
+        since = utcnow() - timedelta(days=recent_days)
+        users, admins, recent_logins = (
+            db.session.query(
+                func.count(User.id),
+                func.count(User.id).filter(User.role == "admin"),
+                func.count(User.id).filter(User.login_at >= since),
+            )
+            .filter(User.organisation_id == self.id)
+            .one()
+        )
+        return OrganisationStatistics(users, admins, recent_logins, recent_days)
+
+
+class Desk(db.Model):
+    # Fields
+    id = db.Column(UUID, primary_key=True)
+    name = db.Column(db.String(), nullable=False)
+    organisation_id = db.Column(
+        UUID,
+        db.ForeignKey("organisation.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    # Relationships
+    bookings = db.relationship("Booking", backref="desk", lazy=True, passive_deletes=True)
+
+    # Methods
+    def __init__(self, name, organisation_id):
+        self.id = str(uuid.uuid4())
+        self.name = name.strip()
+        self.organisation_id = organisation_id
+        self.created_at = utcnow()
+
+
+class Booking(db.Model):
+    __table_args__ = (
+        db.CheckConstraint("starts_at < ends_at", name="ck_booking_period"),
+        # Two bookings for the same desk can never overlap, enforced by a GiST range index
+        ExcludeConstraint(
+            (db.column("desk_id"), "="),
+            (db.text("tstzrange(starts_at, ends_at)"), "&&"),
+            name="ex_booking_desk_period",
+            using="gist",
+        ),
+    )
+
+    # Fields
+    id = db.Column(UUID, primary_key=True)
+    desk_id = db.Column(
+        UUID,
+        db.ForeignKey("desk.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    user_id = db.Column(
+        UUID,
+        db.ForeignKey("user_account.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    starts_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    ends_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Methods
+    def __init__(self, desk_id, user_id, starts_at, ends_at):
+        self.id = str(uuid.uuid4())
+        self.desk_id = desk_id
+        self.user_id = user_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.created_at = utcnow()
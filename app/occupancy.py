@@ -0,0 +1,148 @@
+import threading
+from datetime import timedelta
+
+from app.cache import TTLCache
+
+SLOT = timedelta(minutes=15)
+
+
+class OccupancyBitmap(object):
+    """Desk by 15 minute slot occupancy for one organisation over one day, packed into integer bitsets.
+
+    Each desk has a row bitset with a bit per slot, and each slot has a column bitset with a bit per desk,
+    so "how many desks are free" is a popcount of OR-ed columns rather than a loop over bookings. Bookings
+    are kept per desk so that a desk's row can be rebuilt exactly when one is added or removed, and only
+    the changed slots of the column bitsets are touched.
+    """
+
+    def __init__(self, desk_ids, starts_at, ends_at, bookings=()):
+        self.desk_ids = list(desk_ids)
+        self.index = {desk_id: i for i, desk_id in enumerate(self.desk_ids)}
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.slots = int((ends_at - starts_at) / SLOT)
+        self.rows = [0] * len(self.desk_ids)
+        self.columns = [0] * self.slots
+        self.bookings = {desk_id: set() for desk_id in self.desk_ids}
+        self._lock = threading.Lock()
+        for desk_id, booking_starts_at, booking_ends_at in bookings:
+            self.bookings[desk_id].add((booking_starts_at, booking_ends_at))
+        for desk_id in self.desk_ids:
+            self._update_row(desk_id)
+
+    @classmethod
+    def load_day(cls, organisation_id, day, timezone="UTC"):
+        from app.availability import AvailabilityIndex, day_bounds
+
+        starts_at, ends_at = day_bounds(day, timezone)
+        index = AvailabilityIndex.load(organisation_id, starts_at, ends_at)
+        bookings = [
+            (desk_id, booking_starts_at, booking_ends_at)
+            for desk_id, intervals in index.desks.items()
+            for booking_starts_at, booking_ends_at in zip(intervals.starts, intervals.ends)
+        ]
+        return cls(index.desk_ids, starts_at, ends_at, bookings)
+
+    def mask(self, starts_at, ends_at):
+        """Bitset of the slots touched by a period, clipped to the day."""
+        first = max(int((starts_at - self.starts_at) // SLOT), 0)
+        # A period ending part way through a slot still occupies it
+        last = min(-int(-(ends_at - self.starts_at) // SLOT), self.slots)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def add(self, desk_id, starts_at, ends_at):
+        if desk_id in self.index:
+            with self._lock:
+                self.bookings[desk_id].add((starts_at, ends_at))
+                self._update_row(desk_id)
+
+    def remove(self, desk_id, starts_at, ends_at):
+        if desk_id in self.index:
+            with self._lock:
+                self.bookings[desk_id].discard((starts_at, ends_at))
+                self._update_row(desk_id)
+
+    def _update_row(self, desk_id):
+        i = self.index[desk_id]
+        row = 0
+        for starts_at, ends_at in self.bookings[desk_id]:
+            row |= self.mask(starts_at, ends_at)
+        changed = self.rows[i] ^ row
+        desk_bit = 1 << i
+        while changed:
+            slot = (changed & -changed).bit_length() - 1
+            self.columns[slot] ^= desk_bit
+            changed &= changed - 1
+        self.rows[i] = row
+
+    def occupied(self, starts_at, ends_at):
+        """Bitset of the desks booked at any point in a period."""
+        mask = self.mask(starts_at, ends_at)
+        desks = 0
+        while mask:
+            slot = (mask & -mask).bit_length() - 1
+            desks |= self.columns[slot]
+            mask &= mask - 1
+        return desks
+
+    def free_count(self, starts_at, ends_at):
+        return len(self.desk_ids) - self.occupied(starts_at, ends_at).bit_count()
+
+    def free_desks(self, starts_at, ends_at):
+        desks = self.occupied(starts_at, ends_at)
+        return [desk_id for i, desk_id in enumerate(self.desk_ids) if not desks >> i & 1]
+
+    def heatmap(self):
+        """Number of desks booked in each slot of the day."""
+        return [column.bit_count() for column in self.columns]
+
+
+class OccupancyCache(object):
+    """Per-process cache of occupancy bitmaps by organisation and day, updated in place as bookings change.
+
+    Up to OCCUPANCY_CACHE_MAXSIZE organisations are cached, each with up to OCCUPANCY_CACHE_DAYS days.
+    """
+
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        self.days = 14
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = TTLCache(
+            maxsize=app.config.get("OCCUPANCY_CACHE_MAXSIZE", 256),
+            ttl=app.config.get("OCCUPANCY_CACHE_TTL", 60),
+        )
+        self.days = app.config.get("OCCUPANCY_CACHE_DAYS", 14)
+        app.extensions["occupancy"] = self
+
+    def get(self, organisation_id, day, timezone="UTC"):
+        bitmaps = self.cache.get(organisation_id)
+        if bitmaps is None:
+            bitmaps = TTLCache(maxsize=self.days, ttl=self.cache.ttl)
+            self.cache.set(organisation_id, bitmaps)
+        key = (day, timezone)
+        bitmap = bitmaps.get(key)
+        if bitmap is None:
+            bitmap = OccupancyBitmap.load_day(organisation_id, day, timezone)
+            bitmaps.set(key, bitmap)
+        return bitmap
+
+    def booked(self, organisation_id, desk_id, periods):
+        bitmaps = self.cache.get(organisation_id)
+        for bitmap in bitmaps.values() if bitmaps is not None else ():
+            for starts_at, ends_at in periods:
+                if starts_at < bitmap.ends_at and ends_at > bitmap.starts_at:
+                    bitmap.add(desk_id, starts_at, ends_at)
+
+    def cancelled(self, organisation_id, desk_id, periods):
+        bitmaps = self.cache.get(organisation_id)
+        for bitmap in bitmaps.values() if bitmaps is not None else ():
+            for starts_at, ends_at in periods:
+                bitmap.remove(desk_id, starts_at, ends_at)
+
+    def invalidate(self, organisation_id):
+        self.cache.delete(organisation_id)
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from flask_login import current_user
 from flask_wtf import FlaskForm
-from wtforms import StringField
-from wtforms.validators import InputRequired, Length, ValidationError
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import DateField, IntegerField, SelectMultipleField, StringField, TimeField
+from wtforms.validators import InputRequired, Length, NumberRange, ValidationError
+from wtforms.widgets import CheckboxInput, ListWidget
 
-from app.models import Organisation
+from app import blocklist, domains
+from app.domains import is_public_suffix
 
 
 class OrganisationForm(FlaskForm):
@@ -24,10 +29,74 @@ class OrganisationForm(FlaskForm):
     )
 
     def validate_domain(self, domain):
-        # If organisation has changed domains, prevent duplication with another organisation
-        if current_user.organisation and current_user.organisation.domain != domain.data:
-           raise ValidationError("Domain name is already in use")
+        # Prevent organisations owning a public suffix, which would match every domain registered under it
+        if is_public_suffix(domain.data):
+            raise ValidationError("Domain name must be a registered domain, not a suffix such as co.uk")
+
+        # Prevent organisations being created for personal email domains
+        if blocklist.is_blocked(domain.data):
+            raise ValidationError("Domain name must not be a personal email domain")
+
+        # Prevent duplication of a domain that is already owned by another organisation, even one being deleted
+        organisation = domains.resolve(domain.data, subdomains=False, pending=True)
+        if organisation is not None and organisation.id != current_user.organisation_id:
+            raise ValidationError("Domain name is already in use")
 
 
 class OrganisationDeleteForm(FlaskForm):
     pass
+
+
+class RecurringBookingForm(FlaskForm):
+    starts_on = DateField("First day", validators=[InputRequired(message="Enter the first day")])
+    until = DateField("Last day", validators=[InputRequired(message="Enter the last day")])
+    starts_at = TimeField("Start time", validators=[InputRequired(message="Enter a start time")])
+    ends_at = TimeField("End time", validators=[InputRequired(message="Enter an end time")])
+    weekdays = SelectMultipleField(
+        "Days",
+        validators=[InputRequired(message="Select at least one day")],
+        choices=[
+            (0, "Monday"),
+            (1, "Tuesday"),
+            (2, "Wednesday"),
+            (3, "Thursday"),
+            (4, "Friday"),
+            (5, "Saturday"),
+            (6, "Sunday"),
+        ],
+        coerce=int,
+        option_widget=CheckboxInput(),
+        widget=ListWidget(prefix_label=False),
+    )
+    interval = IntegerField(
+        "Repeat every",
+        validators=[
+            InputRequired(message="Enter how many weeks between bookings"),
+            NumberRange(min=1, max=52, message="Weeks between bookings must be between 1 and 52"),
+        ],
+        default=1,
+        description="Number of weeks between bookings.",
+    )
+
+    def validate_until(self, until):
+        if self.starts_on.data and until.data:
+            if until.data < self.starts_on.data:
+                raise ValidationError("Last day must be on or after the first day")
+            if until.data - self.starts_on.data > timedelta(days=366):
+                raise ValidationError("Recurring bookings can't last more than a year")
+
+    def validate_ends_at(self, ends_at):
+        if self.starts_at.data and ends_at.data and ends_at.data <= self.starts_at.data:
+            raise ValidationError("End time must be after the start time")
+
+
+class UserImportForm(FlaskForm):
+    file = FileField(
+        "Users file",
+        validators=[
+            FileRequired(message="Select a file to import"),
+            FileAllowed(["csv", "jsonl", "ndjson"], message="File must be a CSV or JSON lines file"),
+        ],
+        description="A CSV file with name and email_address columns, and optional timezone, role and password "
+        "columns, or a JSON lines file with the same keys.",
+    )
@@ -1,14 +1,53 @@
-from datetime import datetime
+from datetime import date, timedelta
 
-import pytz
-from flask import flash, redirect, render_template, request, url_for
+from flask import (
+    Response,
+    abort,
+    current_app,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
 from flask_login import current_user, login_required
 from werkzeug.exceptions import Forbidden
 
-from app import db, limiter
-from app.models import Organisation
+from app import db, domains, limiter, member_search, occupancy, organisation_deleter, user_cache
+from app.conditional import conditional
+from app.imports import UserImport, read_rows, write_csv
+from app.members import decode_cursor, export_rows, iter_members, page, write_json
+from app.models import Desk, Organisation
 from app.organisation import bp
-from app.organisation.forms import OrganisationDeleteForm, OrganisationForm
+from app.organisation.forms import OrganisationDeleteForm, OrganisationForm, RecurringBookingForm, UserImportForm
+from app.recurrence import book_periods, expand
+from app.timezones import localise, localise_many, utcnow
+
+# Endpoints still open to members of an organisation being deleted
+DELETION_ENDPOINTS = {
+    "main.accessibility",
+    "main.cookies",
+    "main.privacy",
+    "organisation.deletion",
+    "static",
+    "user.logout",
+}
+
+
+@bp.before_app_request
+def organisation_being_deleted():
+    # Members of an organisation being deleted only see the progress of its deletion, on every blueprint
+    if request.endpoint in DELETION_ENDPOINTS:
+        return None
+    if (
+        current_user.is_authenticated
+        and current_user.organisation is not None
+        and organisation_deleter.ready()
+        and current_user.organisation.deletion_requested_at is not None
+    ):
+        return redirect(url_for("organisation.deletion"))
 
 
 @bp.route("/new", methods=["GET", "POST"])
@@ -30,6 +69,8 @@ def create():
         db.session.add(new_organisation)
         db.session.add(current_user)
         db.session.commit()
+        user_cache.invalidate_user(current_user.id)
+        domains.clear()
         flash(
             f"<a href='{url_for('organisation.view')}' class='alert-link'>{new_organisation.name}</a> has been created.",
             "success",
@@ -44,7 +85,150 @@ def create():
 @limiter.limit("2 per second", key_func=lambda: current_user.id)
 def view():
     """View the authenticated users organisation."""
-    return render_template("view_organisation.html", title=current_user.organisation.name)
+    statistics = current_user.organisation.statistics()
+    return conditional(
+        lambda: render_template(
+            "view_organisation.html",
+            title=current_user.organisation.name,
+            statistics=statistics,
+        ),
+        current_user.organisation,
+        statistics,
+    )
+
+
+@bp.route("/occupancy", methods=["GET"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def occupancy_view():
+    """View desk occupancy across the authenticated users organisation for a day."""
+
+    # Only allow admins to view organisation wide occupancy
+    if current_user.role != "admin":
+        raise Forbidden()
+
+    now = localise(utcnow(), current_user.timezone)
+    try:
+        day = date.fromisoformat(request.args.get("day", now.date().isoformat()))
+    except ValueError:
+        day = now.date()
+
+    bitmap = occupancy.get(current_user.organisation_id, day, current_user.timezone)
+    free_now = bitmap.free_count(now, now + timedelta(minutes=1)) if day == now.date() else None
+    desks = len(bitmap.desk_ids)
+    heatmap = bitmap.heatmap()
+    slot_times = localise_many(
+        [bitmap.starts_at + i * timedelta(minutes=15) for i in range(len(heatmap))], current_user.timezone
+    )
+    slots = [
+        (starts_at, booked, round(booked / desks * 4) if desks else 0) for starts_at, booked in zip(slot_times, heatmap)
+    ]
+
+    return render_template(
+        "occupancy.html",
+        title="Desk occupancy",
+        day=day,
+        desks=desks,
+        free_now=free_now,
+        slots=slots,
+    )
+
+
+@bp.route("/users", methods=["GET"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def members():
+    """List the members of the authenticated users organisation a page at a time."""
+
+    # Users without an organisation have no members to list
+    if not current_user.organisation_id:
+        raise Forbidden()
+
+    after = decode_cursor(request.args["after"]) if "after" in request.args else None
+    users, cursor = page(current_user.organisation_id, after, current_app.config["MEMBERS_PAGE_SIZE"])
+    return render_template("members.html", title="Members", users=users, cursor=cursor, first_page=after is None)
+
+
+@bp.route("/users/search", methods=["GET"])
+@login_required
+@limiter.limit("10 per second", key_func=lambda: current_user.id)
+def search_members():
+    """Find members of the authenticated users organisation by name or email address, as you type."""
+
+    # Users without an organisation have no members to find
+    if not current_user.organisation_id:
+        raise Forbidden()
+
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+    results = member_search.search(current_user.organisation_id, request.args.get("q", ""), limit)
+    return jsonify(
+        users=[
+            {
+                "id": result.id,
+                "name": result.name,
+                "email_address": result.email_address,
+                "url": url_for("user.view", id=result.id),
+            }
+            for result in results
+        ]
+    )
+
+
+@bp.route("/users/export", methods=["GET"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def export_members():
+    """Export the members of the authenticated users organisation as CSV or JSON."""
+
+    # Only allow admins to export their own organisation's members
+    if current_user.role != "admin":
+        raise Forbidden()
+
+    format = request.args.get("format", "csv")
+    if format not in ("csv", "json"):
+        abort(400)
+    rows = iter_members(current_user.organisation_id, current_app.config["MEMBERS_EXPORT_BATCH_SIZE"])
+    # Members are fetched a batch at a time as the response is written, so memory doesn't grow with the organisation
+    if format == "json":
+        body, mimetype = write_json(rows), "application/json"
+    else:
+        body, mimetype = write_csv(export_rows(rows)), "text/csv"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=members.{format}"},
+    )
+
+
+@bp.route("/users/import", methods=["GET", "POST"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def import_users():
+    """Import users into the authenticated users organisation from a CSV or JSON lines file."""
+
+    # Only allow admins to import users into their own organisation
+    if current_user.role != "admin":
+        raise Forbidden()
+
+    form = UserImportForm()
+
+    if form.validate_on_submit():
+        upload = form.file.data
+        user_import = UserImport(
+            current_user.organisation_id,
+            timezone=current_user.timezone,
+            chunk_size=current_app.config["IMPORT_CHUNK_SIZE"],
+        )
+        format = "jsonl" if upload.filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+        # The report is streamed as each chunk is imported, so large files don't hit the router timeout
+        report = write_csv(user_import.run(read_rows(upload.stream, format)))
+        return Response(
+            stream_with_context(report),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=import-report.csv"},
+        )
+
+    return render_template("import_users.html", title="Import users", form=form)
 
 
 @bp.route("/edit", methods=["GET", "POST"])
@@ -62,9 +246,11 @@ def edit():
     if form.validate_on_submit():
         current_user.organisation.name = form.name.data.strip()
         current_user.organisation.domain = form.domain.data.lower().strip()
-        current_user.organisation.updated_at = pytz.utc.localize(datetime.utcnow())
+        current_user.organisation.updated_at = utcnow()
         db.session.add(current_user)
         db.session.commit()
+        user_cache.invalidate_organisation(current_user.organisation_id)
+        domains.clear()
         flash(
             f"Your changes to <a href='{url_for('organisation.view')}' class='alert-link'>{current_user.organisation.name}</a> have been saved.",
             "success",
@@ -98,10 +284,85 @@ def delete():
             "delete_organisation.html",
             title="Delete organisation",
             form=form,
+            statistics=current_user.organisation.statistics(),
         )
     elif request.method == "POST":
-        org = current_user.organisation.name
-        db.session.delete(current_user.organisation)
-        db.session.commit()
-        flash(f"{org} has been deleted.", "success")
+        if not organisation_deleter.ready():
+            flash("Organisations can't be deleted while the database is being upgraded. Try again shortly.", "warning")
+            return redirect(url_for("organisation.view"))
+        organisation_deleter.request(current_user.organisation)
+        current_app.logger.info(
+            f"User {current_user.id} requested deletion of organisation {current_user.organisation_id}"
+        )
+        flash(f"{current_user.organisation.name} is being deleted.", "success")
+        return redirect(url_for("organisation.deletion"))
+
+
+@bp.route("/deletion", methods=["GET"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def deletion():
+    """View the progress of deleting the authenticated users organisation."""
+    organisation = current_user.organisation
+    if organisation is None or not organisation_deleter.ready() or organisation.deletion_requested_at is None:
         return redirect(url_for("main.index"))
+
+    # Pick up a deletion that was interrupted, which is a no-op while another thread or process is deleting it
+    organisation_deleter.start(organisation.id)
+    response = current_app.make_response(
+        render_template(
+            "deletion.html",
+            title=f"Deleting {organisation.name}",
+            progress=organisation_deleter.progress(organisation.id),
+        )
+    )
+    response.headers["Refresh"] = "5"
+    return response
+
+
+@bp.route("/desks/<uuid:id>/bookings/recurring", methods=["GET", "POST"])
+@login_required
+@limiter.limit("2 per second", key_func=lambda: current_user.id)
+def book_recurring(id):
+    """Book a Desk with a specific ID on a weekly recurrence."""
+    desk = Desk.query.get_or_404(str(id))
+
+    # Prevent authenticated users from booking desks in other organisations
+    if desk.organisation_id != current_user.organisation_id:
+        raise Forbidden()
+
+    form = RecurringBookingForm()
+
+    if form.validate_on_submit():
+        periods = expand(
+            starts_on=form.starts_on.data,
+            until=form.until.data,
+            weekdays=form.weekdays.data,
+            starts_at=form.starts_at.data,
+            ends_at=form.ends_at.data,
+            timezone=current_user.timezone,
+            interval=form.interval.data,
+        )
+        booked, conflicts = book_periods(desk.id, current_user.id, periods)
+        db.session.commit()
+        occupancy.booked(desk.organisation_id, desk.id, booked)
+        days = ", ".join(starts_at.strftime("%A %d/%m/%Y") for starts_at, _ in sorted(conflicts))
+        if not booked:
+            if conflicts:
+                flash(f"{desk.name} was not booked, as it was already booked on {days}.", "warning")
+            else:
+                flash(
+                    f"{desk.name} was not booked, as none of the days selected are between the first and last day.",
+                    "warning",
+                )
+            return redirect(url_for("organisation.book_recurring", id=desk.id))
+        if conflicts:
+            flash(
+                f"{desk.name} has been booked {len(booked)} times. It was already booked on {days}.",
+                "info",
+            )
+        else:
+            flash(f"{desk.name} has been booked {len(booked)} times.", "success")
+        return redirect(url_for("organisation.view"))
+
+    return render_template("recurring_booking.html", title=f"Book {desk.name}", form=form, desk=desk)
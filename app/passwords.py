@@ -0,0 +1,162 @@
+import math
+import os
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import bcrypt
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.metrics import add_request_time
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+passwords_cli = AppGroup("passwords", help="Manage password hashing.")
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed_password):
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def rounds_from_hash(hashed_password):
+    """Return the bcrypt cost factor stored in a hash, e.g. 12 for b"$2b$12$..."."""
+    return int(hashed_password.split(b"$")[2])
+
+
+def calibrate(target_ms, min_rounds=10, probe_rounds=10, probes=5):
+    """Choose the highest bcrypt cost that hashes within target_ms on this host.
+
+    Each extra round doubles the work, so the median of a few probe hashes is enough to estimate every other cost.
+    """
+    timings = []
+    for _ in range(probes):
+        start = time.perf_counter()
+        _hashpw(b"calibration", probe_rounds)
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed_ms = statistics.median(timings)
+    rounds = probe_rounds + math.floor(math.log2(target_ms / max(elapsed_ms, 0.001)))
+    return max(min_rounds, min(rounds, MAX_ROUNDS))
+
+
+@passwords_cli.command("calibrate")
+def calibrate_command():
+    """Print the bcrypt cost to set as PASSWORD_HASH_ROUNDS for PASSWORD_HASH_TARGET_MS on this host."""
+    rounds = calibrate(
+        current_app.config.get("PASSWORD_HASH_TARGET_MS", 250),
+        min_rounds=current_app.config.get("PASSWORD_HASH_MIN_ROUNDS", 10),
+    )
+    click.echo(f"PASSWORD_HASH_ROUNDS={rounds}")
+
+
+class PasswordHasher(object):
+    """Runs bcrypt on a bounded thread or process pool instead of the request worker.
+
+    At most workers + queue_size operations may be in flight; further callers wait up to queue_timeout
+    seconds for a slot and then get a 503, so a burst of logins can't pin every request thread on bcrypt.
+
+    The cost comes from PASSWORD_HASH_ROUNDS, so every process hashes at the same cost. Use "flask passwords
+    calibrate" on a dyno to choose it.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.executor_type = "thread"
+        self.workers = 2
+        self.queue_timeout = 1.0
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = None
+        self._pid = None
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.executor_type = app.config.get("PASSWORD_HASH_EXECUTOR", "thread")
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", 2)
+        self.queue_timeout = app.config.get("PASSWORD_HASH_QUEUE_TIMEOUT", 1.0)
+        self._slots = threading.BoundedSemaphore(self.workers + app.config.get("PASSWORD_HASH_QUEUE_SIZE", 8))
+        self.shutdown()
+
+        self.rounds = app.config.get("PASSWORD_HASH_ROUNDS", 12)
+        app.cli.add_command(passwords_cli)
+        app.logger.info(f"Password hashing with bcrypt cost {self.rounds} on a {self.executor_type} pool")
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode("UTF-8"), self.rounds)
+
+    def check(self, password, hashed_password):
+        return self._run(_checkpw, password.encode("UTF-8"), hashed_password)
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords, such as for a bulk import, with at most one in flight per pool worker.
+
+        Slots are waited for rather than shed, and the rest of the queue is left free for log ins.
+        """
+        futures, running = [], set()
+        start = time.perf_counter()
+        try:
+            for password in passwords:
+                if len(running) >= self.workers:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+                self._slots.acquire()
+                try:
+                    future = self._get_executor().submit(_hashpw, password.encode("UTF-8"), self.rounds)
+                except BaseException:
+                    self._slots.release()
+                    raise
+                future.add_done_callback(lambda _: self._slots.release())
+                futures.append(future)
+                running.add(future)
+            return [future.result() for future in futures]
+        finally:
+            add_request_time("password_hash", time.perf_counter() - start)
+
+    def check_dummy(self, password):
+        """Check a password against a hash no account has, so unknown email addresses take as long as known ones."""
+        if self._dummy_hash is None or self.needs_rehash(self._dummy_hash):
+            self._dummy_hash = self.hash(secrets.token_urlsafe())
+        self.check(password, self._dummy_hash)
+        return False
+
+    def needs_rehash(self, hashed_password):
+        # Only ever raise the cost, so a lower PASSWORD_HASH_ROUNDS doesn't weaken existing hashes
+        return rounds_from_hash(hashed_password) < self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_executor(self):
+        # Pools don't survive a fork, so each gunicorn worker creates its own on first use
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.executor_type == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ServiceUnavailable("Too many requests are being processed. Please try again in a moment.")
+        start = time.perf_counter()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            add_request_time("password_hash", time.perf_counter() - start)
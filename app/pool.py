@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class PoolMetrics(object):
+    """Checkout counts and time spent waiting for a connection, shared by a pool and its recreations."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class TimedPoolMixin(object):
+    def __init__(self, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+        self.max_overflow = kwargs.get("max_overflow", 10)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        pool.max_overflow = self.max_overflow
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+@event.listens_for(TimedQueuePool, "connect")
+def connect(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+@event.listens_for(TimedQueuePool, "checkout")
+def checkout(dbapi_connection, connection_record, connection_proxy):
+    # A connection opened before a fork must not be used, or closed, by the child
+    if connection_record.info["pid"] != os.getpid():
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError(
+            f"Connection belongs to pid {connection_record.info['pid']}, attempting to check out in pid {os.getpid()}"
+        )
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the DATABASE_POOL_* settings.
+
+    In "pgbouncer" mode PgBouncer does the pooling in transaction mode, so each checkout opens a new
+    connection to it and nothing is kept on the server between transactions. psycopg2 never prepares
+    statements on the server, so no other changes are needed.
+    """
+    if not config.get("SQLALCHEMY_DATABASE_URI", "").startswith("postgresql"):
+        return {}
+    if config.get("DATABASE_POOL_MODE", "queue") == "pgbouncer":
+        return {"poolclass": TimedNullPool}
+    return {
+        "max_overflow": config.get("DATABASE_POOL_MAX_OVERFLOW", 5),
+        "pool_pre_ping": config.get("DATABASE_POOL_PRE_PING", True),
+        "pool_recycle": config.get("DATABASE_POOL_RECYCLE", 1800),
+        "pool_size": config.get("DATABASE_POOL_SIZE", 5),
+        "pool_timeout": config.get("DATABASE_POOL_TIMEOUT", 10),
+        "poolclass": TimedQueuePool,
+    }
+
+
+class DatabasePool(object):
+    """Configures the database connection pool from DATABASE_POOL_* settings and reports its usage.
+
+    Options set explicitly in SQLALCHEMY_ENGINE_OPTIONS take priority.
+    """
+
+    def __init__(self, app=None):
+        self.apps = weakref.WeakSet()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        options = engine_options(app.config)
+        options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+        self.apps.add(app)
+        app.extensions["database_pool"] = self
+
+    def stats(self, app):
+        """Pool size, connections in use and saturation, with checkout wait times since start up."""
+        from app import db
+
+        pool = db.get_engine(app).pool
+        metrics = getattr(pool, "metrics", None) or PoolMetrics()
+        stats = {
+            "checkouts": metrics.checkouts,
+            "timeouts": metrics.timeouts,
+            "wait_seconds": metrics.wait_seconds,
+            "max_wait_seconds": metrics.max_wait_seconds,
+            "mean_wait_seconds": metrics.wait_seconds / metrics.checkouts if metrics.checkouts else 0.0,
+        }
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(getattr(pool, "max_overflow", 0), 0)
+            stats.update(
+                {
+                    "size": pool.size(),
+                    "checked_out": pool.checkedout(),
+                    "idle": pool.checkedin(),
+                    "overflow": max(pool.overflow(), 0),
+                    "saturation": pool.checkedout() / capacity if capacity else 0.0,
+                }
+            )
+        return stats
+
+    def dispose(self):
+        """Drop connections inherited from a parent process without closing them, e.g. after a gunicorn fork."""
+        from app import db
+
+        for app in list(self.apps):
+            db.get_engine(app).dispose(close=False)
@@ -0,0 +1,92 @@
+import gzip
+import json
+import mimetypes
+import os
+
+import brotli
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+# Preferred content codings, best first, with the file suffix each is stored under
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+MANIFEST = os.path.join("dist", "precompressed.json")
+ONE_YEAR = 31536000
+
+static_cli = AppGroup("static", help="Build static assets.")
+
+
+def precompress(static_folder, folder="dist"):
+    """Write .br and .gz siblings for every built file and return a manifest of what was written."""
+    manifest = {}
+    for root, _, files in os.walk(os.path.join(static_folder, folder)):
+        for name in sorted(files):
+            if name.endswith((".br", ".gz", ".json")):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as source:
+                data = source.read()
+            with open(path + ".br", "wb") as target:
+                target.write(brotli.compress(data, quality=11))
+            with open(path + ".gz", "wb") as target:
+                target.write(gzip.compress(data, compresslevel=9, mtime=0))
+            filename = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            manifest[filename] = [encoding for encoding, _ in ENCODINGS]
+    return manifest
+
+
+@static_cli.command("build")
+def build():
+    """Build asset bundles, precompress them and write the manifest."""
+    for bundle in current_app.jinja_env.assets_environment:
+        bundle.build(force=True)
+    manifest = precompress(current_app.static_folder)
+    with open(os.path.join(current_app.static_folder, MANIFEST), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    click.echo(f"Precompressed {len(manifest)} files")
+
+
+class PrecompressedStatic(object):
+    """Serves built assets from their precompressed siblings with far-future immutable caching.
+
+    When the manifest written by "flask static build" is present, bundles are never built at request time
+    and their fingerprinted files are served without compressing them on the fly.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = os.path.join(app.static_folder, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+            app.config["ASSETS_AUTO_BUILD"] = False
+        else:
+            self.manifest = {}
+        app.view_functions["static"] = self.send_static_file
+        app.cli.add_command(static_cli)
+        app.extensions["precompressed_static"] = self
+
+    def send_static_file(self, filename):
+        encodings = self.manifest.get(filename)
+        if encodings is None:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                response = send_from_directory(
+                    current_app.static_folder, filename + suffix, mimetype=mimetype, max_age=ONE_YEAR
+                )
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype, max_age=ONE_YEAR)
+
+        response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+
+import redis
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class Window(object):
+    __slots__ = ("count", "pending", "expires_at", "expiry", "elastic", "synced")
+
+    def __init__(self, count, expires_at, expiry):
+        self.count = count
+        self.pending = 0
+        self.expires_at = expires_at
+        self.expiry = expiry
+        self.elastic = False
+        self.synced = False
+
+
+class HybridStorage(Storage):
+    """Rate limit storage that counts hits in process and syncs them to Redis in the background.
+
+    Use with RATELIMIT_STORAGE_URL = "hybrid+redis://...". Limits are enforced from local fixed window
+    counters, so a request never waits on Redis. Every sync_interval seconds, or wake_delay seconds after a new
+    window is opened, windows with hits since the last sync and windows that haven't been synced yet are sent to
+    Redis in one pipeline, and their local counters are replaced with the global totals, so workers converge on
+    the shared limit. Windows without new hits aren't sent, so a sync costs commands in proportion to recent
+    traffic rather than to every live window. Waiting wake_delay before syncing batches the new windows opened
+    by a burst of requests into one pipeline.
+
+    If Redis is unreachable, hits keep being counted locally and are retried on the next sync. Until Redis
+    returns each process enforces limits on its own, so the effective limit is multiplied by the number of
+    processes rather than requests failing.
+    """
+
+    STORAGE_SCHEME = ["hybrid+redis", "hybrid+rediss"]
+
+    def __init__(self, uri, sync_interval=0.25, wake_delay=0.05, **options):
+        super().__init__(uri, **options)
+        self.redis = redis.Redis.from_url(uri.split("+", 1)[1], socket_timeout=0.1, socket_connect_timeout=0.1)
+        self.sync_interval = float(sync_interval)
+        self.wake_delay = min(float(wake_delay), self.sync_interval)
+        self.windows = {}
+        self.degraded = False
+        self._pid = None
+        self._wake = threading.Event()
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        self._start_sync()
+        now = time.time()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or window.expires_at <= now:
+                window = self.windows[key] = Window(0, now + expiry, expiry)
+                # Sync soon rather than waiting for the interval, to pick up the global count
+                self._wake.set()
+            if elastic_expiry:
+                # Extended in Redis too when the hit is synced
+                window.elastic = True
+                window.expires_at = now + expiry
+            window.count += amount
+            window.pending += amount
+            return window.count
+
+    def get(self, key):
+        window = self.windows.get(key)
+        if window is None or window.expires_at <= time.time():
+            return 0
+        return window.count
+
+    def get_expiry(self, key):
+        window = self.windows.get(key)
+        return int(window.expires_at if window is not None else time.time())
+
+    def check(self):
+        # Limits are still enforced locally while Redis is down, so the storage is always usable
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.windows.clear()
+        try:
+            keys = list(self.redis.scan_iter("LIMITER*"))
+            return self.redis.delete(*keys) if keys else 0
+        except redis.RedisError as error:
+            logger.warning(f"Rate limit reset failed: {error}")
+            return None
+
+    def clear(self, key):
+        with self.lock:
+            self.windows.pop(key, None)
+        try:
+            self.redis.delete(key)
+        except redis.RedisError as error:
+            logger.warning(f"Rate limit clear failed: {error}")
+
+    def sync(self):
+        """Send hits counted since the last sync to Redis in one pipeline and pull back the global counts.
+
+        New windows start from the local count and pick up the global count here, so no request waits on Redis.
+        """
+        now = time.time()
+        batch = self._take_pending(now)
+        if not batch:
+            return
+        try:
+            results = self._send(batch)
+        except redis.RedisError as error:
+            self._restore_pending(batch)
+            if not self.degraded:
+                logger.warning(f"Rate limit sync failed, enforcing limits locally: {error}")
+            self.degraded = True
+            return
+        self._apply(batch, results, now)
+        if self.degraded:
+            logger.info("Rate limit sync recovered")
+        self.degraded = False
+
+    def _take_pending(self, now):
+        with self.lock:
+            for key in [key for key, window in self.windows.items() if window.expires_at <= now]:
+                del self.windows[key]
+            # Windows without new hits keep their last global count until their next hit
+            batch = [
+                (key, window.pending, window.expiry, window.elastic)
+                for key, window in self.windows.items()
+                if window.pending or not window.synced
+            ]
+            for key, _, _, _ in batch:
+                self.windows[key].pending = 0
+        return batch
+
+    def _send(self, batch):
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, amount, expiry, elastic in batch:
+            pipeline.set(key, 0, ex=expiry, nx=True)
+            pipeline.incrby(key, amount)
+            if elastic and amount:
+                pipeline.expire(key, expiry)
+            pipeline.pttl(key)
+        results = iter(pipeline.execute())
+        counts = []
+        for _, amount, _, elastic in batch:
+            next(results)
+            count = next(results)
+            if elastic and amount:
+                next(results)
+            counts.append((count, next(results)))
+        return counts
+
+    def _restore_pending(self, batch):
+        with self.lock:
+            for key, amount, _, _ in batch:
+                if key in self.windows:
+                    self.windows[key].pending += amount
+
+    def _apply(self, batch, results, now):
+        with self.lock:
+            for (key, _, _, _), (count, ttl) in zip(batch, results):
+                window = self.windows.get(key)
+                if window is not None:
+                    window.count = count + window.pending
+                    window.synced = True
+                    if ttl > 0:
+                        window.expires_at = now + ttl / 1000
+
+    def _start_sync(self):
+        # Threads don't survive a fork, so each gunicorn worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self.lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="ratelimit-sync", daemon=True).start()
+
+    def _run(self):
+        while True:
+            if self._wake.wait(self.sync_interval):
+                # Batch the other windows opened by a burst of requests into the same sync
+                time.sleep(self.wake_delay)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Rate limit sync failed")
@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.availability import conflicting_periods
+from app.models import Booking
+from app.timezones import get_zone, utcnow
+
+
+def expand(starts_on, until, weekdays, starts_at, ends_at, timezone, interval=1):
+    """Expand a weekly recurrence into (starts_at, ends_at) periods in a timezone.
+
+    Equivalent to FREQ=WEEKLY;INTERVAL=interval;BYDAY=weekdays;UNTIL=until with weeks starting on Monday.
+    Each weekday's dates are computed arithmetically from the first week rather than by stepping through
+    every day in the range.
+    """
+    zone = get_zone(timezone)
+    monday = starts_on - timedelta(days=starts_on.weekday())
+    step = 7 * interval
+    dates = []
+    for weekday in set(weekdays):
+        first = monday + timedelta(days=weekday)
+        if first < starts_on:
+            first += timedelta(days=step)
+        count = max((until - first).days // step + 1, 0)
+        dates.extend(first + timedelta(days=step * k) for k in range(count))
+    return [
+        (zone.localize(datetime.combine(date, starts_at)), zone.localize(datetime.combine(date, ends_at)))
+        for date in sorted(dates)
+    ]
+
+
+def book_periods(desk_id, user_id, periods):
+    """Book a desk for every period that is free, returning the booked and conflicting periods.
+
+    Conflicts are found with one set-based query, then the remaining periods are inserted with one
+    multi-row INSERT. Any booking made by someone else in between is skipped by ON CONFLICT DO NOTHING
+    against the exclusion constraint and reported as a conflict too.
+    """
+    conflicts = conflicting_periods(desk_id, periods)
+    free = [period for period in periods if period not in conflicts]
+    booked = set()
+    if free:
+        created_at = utcnow()
+        statement = (
+            insert(Booking)
+            .values(
+                [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "desk_id": desk_id,
+                        "user_id": user_id,
+                        "starts_at": starts_at,
+                        "ends_at": ends_at,
+                        "created_at": created_at,
+                    }
+                    for starts_at, ends_at in free
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(Booking.starts_at, Booking.ends_at)
+        )
+        booked = {(starts_at, ends_at) for starts_at, ends_at in db.session.execute(statement)}
+    return (
+        [period for period in periods if period in booked],
+        [period for period in periods if period not in booked],
+    )
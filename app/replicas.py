@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+import weakref
+
+from flask import has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+# Replication lag in seconds, treating a replica that has replayed everything it received as up to date
+LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def with_connect_timeout(url, seconds):
+    """A Postgres URL that gives up connecting after a number of seconds, unless it already sets a timeout."""
+    url = make_url(url)
+    if url.drivername.startswith("postgresql") and "connect_timeout" not in url.query:
+        url = url.update_query_dict({"connect_timeout": str(seconds)})
+    return url.render_as_string(hide_password=False)
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends reads in GET and HEAD requests to a replica when one is healthy.
+
+    Flushes, other statements and everything after the first write in a session go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if clause is not None and not isinstance(clause, Select):
+            self.info["wrote"] = True
+        elif not self.info.get("wrote"):
+            router = self.app.extensions.get("replicas")
+            engine = router.replica(self) if router is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def flushing(db_session, flush_context, instances):
+    # The flush and every statement after it go to the primary
+    db_session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def pin_to_primary(db_session):
+    # Send this client's reads to the primary for a while, so it sees its own changes
+    if db_session.info.pop("wrote", False) and has_request_context():
+        router = db_session.app.extensions.get("replicas")
+        if router is not None and router.keys:
+            session["primary_until"] = int(time.time()) + router.pin_seconds
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter(object):
+    """Adds DATABASE_REPLICA_URLS as binds and picks a healthy replica for each request.
+
+    Replicas are checked at most every DATABASE_REPLICA_CHECK_INTERVAL seconds, and are skipped while they
+    lag by more than DATABASE_REPLICA_MAX_LAG seconds or after a connection error. Checks run on a request
+    thread, so connecting to a replica gives up after DATABASE_REPLICA_CONNECT_TIMEOUT seconds rather than
+    stalling the request for the TCP connect timeout when the replica can't be reached. Clients are pinned to the
+    primary for DATABASE_REPLICA_PIN_SECONDS after they write.
+    """
+
+    def __init__(self, app=None):
+        self.keys = []
+        self.check_interval = 5.0
+        self.max_lag = 5.0
+        self.pin_seconds = 10
+        self.health = {}
+        self.engines = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.check_interval = app.config.get("DATABASE_REPLICA_CHECK_INTERVAL", 5.0)
+        self.max_lag = app.config.get("DATABASE_REPLICA_MAX_LAG", 5.0)
+        self.pin_seconds = app.config.get("DATABASE_REPLICA_PIN_SECONDS", 10)
+        connect_timeout = app.config.get("DATABASE_REPLICA_CONNECT_TIMEOUT", 2)
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        self.keys = []
+        for index, url in enumerate(app.config.get("DATABASE_REPLICA_URLS", [])):
+            key = f"replica_{index}"
+            binds[key] = with_connect_timeout(url, connect_timeout)
+            self.keys.append(key)
+        if self.keys:
+            app.config["SQLALCHEMY_BINDS"] = binds
+        self.health = {}
+        app.extensions["replicas"] = self
+
+    def replica(self, db_session):
+        """The engine for this session's replica, or None if the primary should be used."""
+        if not self.keys or not has_request_context() or request.method not in ("GET", "HEAD"):
+            return None
+        if session.get("primary_until", 0) > time.time():
+            return None
+        if "replica" not in db_session.info:
+            healthy = [key for key in self.keys if self.healthy(db_session.app, key)]
+            # Stay on one replica for the whole request, so reads are consistent with each other
+            db_session.info["replica"] = random.choice(healthy) if healthy else None
+        key = db_session.info["replica"]
+        return self.engine(db_session.app, key) if key is not None else None
+
+    def engine(self, app, key):
+        from app import db
+
+        engine = db.get_engine(app, bind=key)
+        if not event.contains(engine, "handle_error", self._handle_error):
+            event.listen(engine, "handle_error", self._handle_error)
+            self.engines[engine] = key
+        return engine
+
+    def healthy(self, app, key):
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked_at = self.health.get(key, (False, None))
+            if checked_at is not None and now - checked_at < self.check_interval:
+                return healthy
+            # Other threads keep the last result while this one checks
+            self.health[key] = (healthy, now)
+
+        engine = self.engine(app, key)
+        try:
+            with engine.connect() as connection:
+                lag = connection.scalar(LAG_SQL) if engine.dialect.name == "postgresql" else 0
+        except Exception as error:
+            app.logger.warning(f"Database replica {key} is unavailable: {error}")
+            healthy = False
+        else:
+            healthy = lag is not None and float(lag) <= self.max_lag
+            if not healthy:
+                app.logger.warning(f"Database replica {key} is {lag} seconds behind")
+        with self._lock:
+            self.health[key] = (healthy, time.monotonic())
+        return healthy
+
+    def _handle_error(self, context):
+        # Skip a replica that drops connections until its next check
+        if context.is_disconnect and context.engine in self.engines:
+            with self._lock:
+                self.health[self.engines[context.engine]] = (False, time.monotonic())
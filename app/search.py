@@ -0,0 +1,139 @@
+from collections import namedtuple
+
+from sqlalchemy import func, or_, select, union
+
+from app.cache import TTLCache
+
+Result = namedtuple("Result", ["id", "name", "email_address"])
+
+
+def normalise(query):
+    return " ".join(query.lower().split())
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def matches(result, prefix):
+    return result.name.lower().startswith(prefix) or result.email_address.lower().startswith(prefix)
+
+
+class MemberSearch(object):
+    """Finds members of an organisation by the start of their name or email address, then by trigram similarity.
+
+    Prefix matches are served by the (organisation_id, lower(name) COLLATE "C", id) and (organisation_id,
+    lower(email_address) COLLATE "C") indexes, in the byte order of lower case names, and cached for
+    SEARCH_CACHE_TTL seconds, for up to SEARCH_CACHE_PREFIXES prefixes in each of SEARCH_CACHE_MAXSIZE
+    organisations. While someone types, a longer prefix is answered from a cached shorter one that held every match,
+    without a query. Queries of three or more characters that don't fill the results with prefix matches are topped
+    up with substring and fuzzy matches from the trigram indexes, which aren't cached.
+
+    Only the process that changes an organisation's members drops its cached prefixes, so other processes can
+    return a removed member, or miss a new one, for up to SEARCH_CACHE_TTL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.cache = TTLCache()
+        self.cache_rows = 200
+        self.prefixes = 32
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = TTLCache(
+            maxsize=app.config.get("SEARCH_CACHE_MAXSIZE", 128),
+            ttl=app.config.get("SEARCH_CACHE_TTL", 5),
+        )
+        self.cache_rows = app.config.get("SEARCH_CACHE_ROWS", 200)
+        self.prefixes = app.config.get("SEARCH_CACHE_PREFIXES", 32)
+        app.extensions["member_search"] = self
+
+    def search(self, organisation_id, query, limit=10):
+        """The top members of an organisation matching a query, prefix matches first in name order."""
+        query = normalise(query)
+        # Users without an organisation have no members, rather than every other user without one
+        if organisation_id is None or not query:
+            return []
+        results = [result for result in self.prefix_matches(organisation_id, query) if matches(result, query)]
+        results = results[:limit]
+        if len(results) < limit and len(query) >= 3:
+            results.extend(self.fuzzy_matches(organisation_id, query, limit - len(results), [r.id for r in results]))
+        return results
+
+    def prefix_matches(self, organisation_id, prefix):
+        """Members whose name or email address starts with the prefix, possibly with extra rows to filter out."""
+        if organisation_id is None:
+            return []
+        cached_prefixes = self.cache.get(organisation_id)
+        if cached_prefixes is None:
+            cached_prefixes = TTLCache(maxsize=self.prefixes, ttl=self.cache.ttl)
+            self.cache.set(organisation_id, cached_prefixes)
+        for length in range(len(prefix), 0, -1):
+            cached = cached_prefixes.get(prefix[:length])
+            # A shorter prefix's results can only be filtered if they held every one of its matches
+            if cached is not None and (length == len(prefix) or cached[1]):
+                return cached[0]
+
+        results = self._query_prefix(organisation_id, prefix, self.cache_rows + 1)
+        complete = len(results) <= self.cache_rows
+        results = results[: self.cache_rows]
+        cached_prefixes.set(prefix, (results, complete))
+        return results
+
+    def fuzzy_matches(self, organisation_id, query, limit, exclude=()):
+        from app import db
+        from app.models import User
+
+        name, email_address = func.lower(User.name), func.lower(User.email_address)
+        pattern = f"%{escape_like(query)}%"
+        conditions = [name.like(pattern, escape="\\"), email_address.like(pattern, escape="\\")]
+        order = [name, User.id]
+        if db.engine.dialect.name == "postgresql":
+            # The pg_trgm % operator matches names above the similarity threshold, most similar first
+            conditions.append(name.op("%")(query))
+            order.insert(0, func.greatest(func.similarity(name, query), func.similarity(email_address, query)).desc())
+
+        statement = (
+            select(User.id, User.name, User.email_address)
+            .where(User.organisation_id == organisation_id, or_(*conditions), User.id.notin_(list(exclude)))
+            .order_by(*order)
+            .limit(limit)
+        )
+        return [Result(*row) for row in db.session.execute(statement)]
+
+    def invalidate(self, organisation_id):
+        """Drop an organisation's cached results after its members change."""
+        if organisation_id is not None:
+            self.cache.delete(organisation_id)
+
+    def _query_prefix(self, organisation_id, prefix, limit):
+        from app import db
+        from app.models import User
+
+        pattern = f"{escape_like(prefix)}%"
+        name, email_address = func.lower(User.name), func.lower(User.email_address)
+        if db.engine.dialect.name == "postgresql":
+            # Matches the collation of the prefix indexes, so they can serve both the LIKE and the ORDER BY
+            name, email_address = name.collate("C"), email_address.collate("C")
+        # Both sides of the union keep their first matches in name order, the order they are merged in, so neither
+        # drops a match that belongs in the results. Names are a range scan of the name prefix index that stops at
+        # the limit. Email addresses are a range scan of the email address prefix index, and only those matches
+        # are sorted by name
+        names = (
+            select(User.id, User.name, User.email_address, name.label("sort"))
+            .where(User.organisation_id == organisation_id, name.like(pattern, escape="\\"))
+            .order_by(name, User.id)
+            .limit(limit)
+            .subquery()
+        )
+        email_addresses = (
+            select(User.id, User.name, User.email_address, name.label("sort"))
+            .where(User.organisation_id == organisation_id, email_address.like(pattern, escape="\\"))
+            .order_by(name, User.id)
+            .limit(limit)
+            .subquery()
+        )
+        matched = union(select(names), select(email_addresses)).subquery()
+        statement = select(matched.c.id, matched.c.name, matched.c.email_address).order_by(matched.c.sort, matched.c.id)
+        return [Result(*row) for row in db.session.execute(statement.limit(limit))]
@@ -0,0 +1,41 @@
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+from wtforms import SelectField
+from wtforms.validators import ValidationError
+
+# Built once per process rather than once per form class
+CHOICES = tuple((name, name.replace("_", " ")) for name in pytz.common_timezones)
+NAMES = frozenset(pytz.common_timezones)
+
+
+def utcnow():
+    """Current time as a timezone aware UTC datetime."""
+    return datetime.now(pytz.utc)
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return pytz.timezone(name)
+
+
+def localise(value, timezone):
+    return value.astimezone(get_zone(timezone))
+
+
+def localise_many(values, timezone):
+    """Convert a list of aware datetimes to a timezone, looking the zone up once for the whole list."""
+    zone = get_zone(timezone)
+    return [value.astimezone(zone) if value is not None else None for value in values]
+
+
+class TimezoneField(SelectField):
+    """Select field of common timezones, validated with a set lookup instead of a scan of every choice."""
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, choices=CHOICES, **kwargs)
+
+    def pre_validate(self, form):
+        if self.data not in NAMES:
+            raise ValidationError(self.gettext("Not a valid choice."))
@@ -1,39 +1,25 @@
-import pytz
 from flask_login import current_user
 from flask_wtf import FlaskForm
-from wtforms import BooleanField, PasswordField, SelectField, StringField
+from wtforms import BooleanField, PasswordField, StringField
 from wtforms.validators import Email, EqualTo, InputRequired, Length, Optional, ValidationError
 
+from app import domains
+from app.blocklist import NotPersonalAddress
+from app.deliverability import Deliverable
 from app.models import User
-
-disallowed_domains = [
-    "aol",
-    "gmail",
-    "googlemail",
-    "hotmail",
-    "icloud",
-    "live",
-    "msn",
-    "outlook",
-    "pm",
-    "proton",
-    "protonmail",
-    "yahoo",
-]
+from app.timezones import TimezoneField
 
 
 class SignupForm(FlaskForm):
-    tz_tuples = []
-    for tz in pytz.common_timezones:
-        tz_tuples.append((tz, tz.replace("_", " ")))
-
     name = StringField("Full name", validators=[InputRequired("Enter your full name")])
 
     email_address = StringField(
         "Organisation email address",
         validators=[
             InputRequired(message="Enter your email address"),
-            Email(granular_message=True, check_deliverability=True),
+            Email(granular_message=True, check_deliverability=False),
+            NotPersonalAddress(),
+            Deliverable(),
             Length(max=256, message="Email address must be 256 characters or fewer"),
         ],
         description="Your organisation, company, business or institution email address.",
@@ -53,19 +39,13 @@ class SignupForm(FlaskForm):
             EqualTo("password", message="Passwords must match."),
         ],
     )
-    timezone = SelectField(
+    timezone = TimezoneField(
         "Timezone",
         validators=[InputRequired(message="Select a timezone")],
-        choices=tz_tuples,
         default="Europe/London",
     )
 
     def validate_email_address(self, email_address):
-        # Prevent users from signing up with personal email addresses
-        for domain in disallowed_domains:
-            if domain in email_address.data.split("@")[1]:
-                raise ValidationError("Email address must not be a personal address.")
-
         # Prevent users from signing up with an email address that is already in use
         user = User.query.filter_by(email_address=email_address.data).first()
         if user is not None:
@@ -77,7 +57,8 @@ class LoginForm(FlaskForm):
         "Email address",
         validators=[
             InputRequired(message="Enter an email address"),
-            Email(granular_message=True, check_deliverability=True),
+            # Deliverability was checked at sign up, so skip the DNS lookup on the login path
+            Email(granular_message=True, check_deliverability=False),
             Length(max=256, message="Email address must be 256 characters or fewer"),
         ],
     )
@@ -93,26 +74,23 @@ class LoginForm(FlaskForm):
 
 
 class UserForm(FlaskForm):
-    tz_tuples = []
-    for tz in pytz.common_timezones:
-        tz_tuples.append((tz, tz.replace("_", " ")))
-
     name = StringField("Full name", validators=[InputRequired("Enter your full name")])
 
     email_address = StringField(
         "Organisation email address",
         validators=[
             InputRequired(message="Enter your email address"),
-            Email(granular_message=True, check_deliverability=True),
+            Email(granular_message=True, check_deliverability=False),
+            NotPersonalAddress(),
+            Deliverable(),
             Length(max=255, message="Email address must be 255 characters or fewer"),
         ],
         description="Your organisation, company, business or institution email address.",
     )
 
-    timezone = SelectField(
+    timezone = TimezoneField(
         "Timezone",
         validators=[InputRequired(message="Select a timezone")],
-        choices=tz_tuples,
         default="Europe/London",
     )
 
@@ -123,9 +101,11 @@ class UserForm(FlaskForm):
             if user is not None:
                 raise ValidationError("Email address is already in use")
 
-        # Prevent users from changing email address domains outside of their organisation domain
-        if email_address.data.split("@")[1] != current_user.organisation.domain:
-            raise ValidationError(f"Email address must be in the {current_user.organisation.domain} domain")
+        # Prevent users from changing email address domains outside of their organisation domain or its subdomains
+        if current_user.organisation_id:
+            organisation = domains.resolve_email(email_address.data)
+            if organisation is None or organisation.id != current_user.organisation_id:
+                raise ValidationError(f"Email address must be in the {current_user.organisation.domain} domain")
 
 
 class UserDeleteForm(FlaskForm):
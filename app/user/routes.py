@@ -1,13 +1,12 @@
-from datetime import datetime
-
-import pytz
 from flask import current_app, flash, redirect, render_template, request, url_for
 from flask_login import current_user, fresh_login_required, login_required, login_user, logout_user
 from werkzeug.exceptions import Forbidden
 from werkzeug.urls import url_parse
 
-from app import db, limiter
-from app.models import Organisation, User
+from app import db, domains, limiter, login_admission, member_search, password_hasher, user_cache
+from app.conditional import conditional
+from app.models import User
+from app.timezones import utcnow
 from app.user import bp
 from app.user.forms import LoginForm, SignupForm, UserDeleteForm, UserForm
 
@@ -25,16 +24,17 @@ def signup():
             timezone=form.timezone.data,
             role="user",
         )
-        user.login_at = pytz.utc.localize(datetime.utcnow())
+        user.login_at = utcnow()
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate_user(user.id)
         current_app.logger.info(f"User {user.id} created")
         login_user(user)
         current_app.logger.info(f"User {current_user.id} logged in")
 
         # If users email address is in an unrecognised domain, ask them to create the organisation,
-        # otherwise, add them to the existing organisation
-        organisation = Organisation.query.filter_by(domain=current_user.email_address.split("@")[1]).first()
+        # otherwise, add them to the existing organisation. Skip the cache, as another process may have deleted it
+        organisation = domains.resolve_email(current_user.email_address, fresh=True)
         if organisation is None:
             flash(
                 "Looks like you're the first person here from your organisation.",
@@ -45,6 +45,8 @@ def signup():
             current_user.organisation_id = organisation.id
             db.session.add(current_user)
             db.session.commit()
+            user_cache.invalidate_user(current_user.id)
+            member_search.invalidate(organisation.id)
             flash(f"Welcome to {organisation.name}.", "success")
             return redirect(url_for("organisation.view"))
 
@@ -55,15 +57,27 @@ def signup():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email_address=form.email_address.data.lower().strip()).first()
-        if user is None or not user.check_password(form.password.data):
+        email_address = form.email_address.data.lower().strip()
+        # Shed attempts with a 429 before checking the password if the account, IP address or bcrypt is busy
+        with login_admission.attempt(email_address):
+            user = User.query.filter_by(email_address=email_address).first()
+            if user is None:
+                valid = password_hasher.check_dummy(form.password.data)
+            else:
+                valid = user.check_password(form.password.data)
+        if not valid:
+            login_admission.failed(email_address)
             current_app.logger.warning("Failed login attempt")
             flash("Invalid email address or password.", "danger")
             return redirect(url_for("user.login"))
         login_user(user, remember=form.remember_me.data)
-        user.login_at = pytz.utc.localize(datetime.utcnow())
+        # Upgrade the stored hash while we have the plaintext password if the bcrypt cost has changed
+        if user.password_needs_rehash():
+            user.set_password(form.password.data)
+        user.login_at = utcnow()
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate_user(user.id)
         current_app.logger.info(f"User {current_user.id} logged in")
         next_page = request.args.get("next")
         if not next_page or url_parse(next_page).netloc != "":
@@ -95,7 +109,12 @@ def view(id):
     if user.organisation_id != current_user.organisation_id:
         raise Forbidden()
 
-    return render_template("view_user.html", title=user.name, user=user)
+    return conditional(
+        lambda: render_template("view_user.html", title=user.name, user=user),
+        user,
+        user.login_at,
+        user.organisation,
+    )
 
 
 @bp.route("/users/<uuid:id>/edit", methods=["GET", "POST"])
@@ -113,9 +132,11 @@ def edit(id):
         current_user.email_address = form.email_address.data.lower().strip()
         current_user.name = form.name.data.strip()
         current_user.timezone = form.timezone.data
-        current_user.updated_at = pytz.utc.localize(datetime.utcnow())
+        current_user.updated_at = utcnow()
         db.session.add(current_user)
         db.session.commit()
+        user_cache.invalidate_user(current_user.id)
+        member_search.invalidate(current_user.organisation_id)
         flash("Account changes have been saved.", "success")
         current_app.logger.info(f"User {current_user.id} updated account")
         return redirect(url_for("user.view", id=current_user.id))
@@ -142,8 +163,12 @@ def delete(id):
         return render_template("delete_user.html", title="Delete account", form=form, user=current_user)
     elif request.method == "POST":
         current_app.logger.info(f"User {current_user.id} deleted account")
+        user_id = current_user.id
+        organisation_id = current_user.organisation_id
         db.session.delete(current_user)
         db.session.commit()
+        user_cache.invalidate_user(user_id)
+        member_search.invalidate(organisation_id)
         flash(
             "Your account and all personal information has been permanently deleted.",
             "success",
@@ -0,0 +1,332 @@
+"""Throughput, latency and queries per request for the sign up, log in, organisation, search and user flows.
+
+Usage: python -m benchmarks.flows [--gunicorn WORKERS] [--requests 200] [--concurrency 8] [--members 0] [--update]
+
+Runs against the database at DATABASE_URL, which must be migrated to head, and creates users and an
+organisation on a benchmark.example.org domain in it, so use a local database. By default each flow is driven
+through the Flask test client and the SQL queries for every request are counted. With --gunicorn the same
+flows are sent over HTTP to that many local gunicorn workers by --concurrency clients, measuring throughput
+and latency only. --members adds that many members to the benchmark organisation first, such as 100000 to
+measure member search and the member directory at scale; baselines are recorded per member count.
+
+Results are compared with benchmarks/baselines.json. A flow fails if it has no baseline for the mode, makes
+more queries per request than its baseline or its p95 latency is more than --tolerance above it. Use --update
+to record new baselines.
+"""
+
+import argparse
+import functools
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import bcrypt
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+
+from app import create_app, db, deliverability
+from app.models import User
+from app.timezones import utcnow
+from config import Config
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DOMAIN = "benchmark.example.org"
+PASSWORD = "benchmark-password"
+
+
+class BenchmarkConfig(Config):
+    RATELIMIT_ENABLED = False
+    WTF_CSRF_ENABLED = False
+
+
+def make_app():
+    app = create_app(BenchmarkConfig)
+    # Skip the DNS lookup for the benchmark domain, which doesn't exist
+    deliverability.positive.set(DOMAIN, True)
+    return app
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class TestClient(object):
+    """Sends requests through the Flask test client, counting the SQL queries each one makes."""
+
+    def __init__(self, app, queries):
+        self.client = app.test_client()
+        self.queries = queries
+
+    def request(self, method, path, data=None):
+        before = self.queries.count
+        response = self.client.open(path, method=method, data=data, base_url="https://localhost")
+        return response.status_code, response.headers.get("Location"), self.queries.count - before
+
+
+class HTTPClient(object):
+    """Sends requests to a local server with its own cookies, as if it came through Heroku's HTTPS router."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, data=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        headers = {"X-Forwarded-Proto": "https"}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{name}={morsel.value}" for name, morsel in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            self.cookies.load(header)
+        connection.close()
+        return response.status, response.headers.get("Location"), None
+
+
+def signup_data(email_address):
+    return {
+        "name": "Benchmark User",
+        "email_address": email_address,
+        "password": PASSWORD,
+        "confirm_password": PASSWORD,
+        "timezone": "Europe/London",
+    }
+
+
+def check(status, location, expected=302):
+    if status != expected:
+        raise RuntimeError(f"Expected {expected} but got {status} (Location: {location})")
+
+
+def setup(app, new_client):
+    """Create an organisation admin, returning an id for this run and the admin's email address and user id."""
+    run = uuid.uuid4().hex[:8]
+    email_address = f"admin-{run}@{DOMAIN}"
+    client = new_client()
+    status, location, _ = client.request("POST", "/signup", signup_data(email_address))
+    check(status, location)
+    # The organisation is left from a previous run if sign up doesn't ask for one, and the admin has joined it
+    if location.endswith("/organisation/new"):
+        status, location, _ = client.request("POST", "/organisation/new", {"name": "Benchmark", "domain": DOMAIN})
+        check(status, location)
+
+    with app.app_context():
+        user = User.query.filter_by(email_address=email_address).one()
+        return run, email_address, user.id
+
+
+def add_members(user_id, run, count, batch_size=1000):
+    """Add count members to the admin's organisation, named like the ones the search flow looks for."""
+    organisation_id = db.session.get(User, user_id).organisation_id
+    # Every member shares one cheap hash, as they never log in
+    password = bcrypt.hashpw(PASSWORD.encode("UTF-8"), bcrypt.gensalt(4))
+    for start in range(0, count, batch_size):
+        members = [
+            {
+                "id": str(uuid.uuid4()),
+                "name": f"Benchmark User {index}",
+                "email_address": f"member-{run}-{index}@{DOMAIN}",
+                "password": password,
+                "timezone": "Europe/London",
+                "organisation_id": organisation_id,
+                "role": "user",
+                "created_at": utcnow(),
+            }
+            for index in range(start, min(start + batch_size, count))
+        ]
+        db.session.execute(insert(User.__table__).values(members))
+        db.session.commit()
+    print(f"Added {count} members")
+
+
+def flows(new_client, run, email_address, user_id):
+    """Each flow as a function of an iteration number returning (status, location, queries)."""
+    logged_in = new_client()
+    check(*logged_in.request("POST", "/login", {"email_address": email_address, "password": PASSWORD})[:2])
+
+    def signup(iteration):
+        address = f"user-{run}-{threading.get_ident()}-{iteration}@{DOMAIN}"
+        return new_client().request("POST", "/signup", signup_data(address))
+
+    def login(iteration):
+        return new_client().request("POST", "/login", {"email_address": email_address, "password": PASSWORD})
+
+    def view_organisation(iteration):
+        return logged_in.request("GET", "/organisation/")
+
+    def search_members(iteration):
+        return logged_in.request("GET", f"/organisation/users/search?q=benchmark+user+{iteration % 10}")
+
+    def view_user(iteration):
+        return logged_in.request("GET", f"/users/{user_id}")
+
+    def edit_user(iteration):
+        data = {"name": f"Benchmark User {iteration}", "email_address": email_address, "timezone": "Europe/London"}
+        return logged_in.request("POST", f"/users/{user_id}/edit", data)
+
+    return {
+        "user.signup": (signup, 302),
+        "user.login": (login, 302),
+        "organisation.view": (view_organisation, 200),
+        "organisation.search": (search_members, 200),
+        "user.view": (view_user, 200),
+        "user.edit": (edit_user, 302),
+    }
+
+
+def measure(flow, expected, requests, concurrency):
+    timings, queries = [], []
+    lock = threading.Lock()
+
+    def one(iteration):
+        start = time.perf_counter()
+        status, location, count = flow(iteration)
+        elapsed = time.perf_counter() - start
+        check(status, location, expected)
+        with lock:
+            timings.append(elapsed * 1000)
+            if count is not None:
+                queries.append(count)
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for iteration in range(requests):
+            one(iteration)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    result = {
+        "requests": requests,
+        "throughput": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 2),
+    }
+    if queries:
+        result["queries"] = max(queries)
+    return result
+
+
+def compare(results, baselines, tolerance):
+    failures = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            failures.append(f"{name} has no baseline, record one with --update")
+            continue
+        if "queries" in result and result["queries"] > baseline.get("queries", result["queries"]):
+            failures.append(f"{name} made {result['queries']} queries per request, baseline is {baseline['queries']}")
+        if result["p95_ms"] > baseline["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name} p95 latency is {result['p95_ms']}ms, baseline is {baseline['p95_ms']}ms")
+    return failures
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = free_port()
+    server = subprocess.Popen(
+        ["gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "benchmarks.wsgi:app"],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn didn't start listening")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--gunicorn", type=int, metavar="WORKERS", help="benchmark local gunicorn workers")
+    parser.add_argument("--requests", type=int, default=200, help="requests per flow")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients with --gunicorn")
+    parser.add_argument("--members", type=int, default=0, help="members to add to the organisation first")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 latency increase")
+    parser.add_argument("--update", action="store_true", help="record the results as the new baselines")
+    args = parser.parse_args()
+
+    app = make_app()
+    queries = QueryCounter()
+    server = None
+    if args.gunicorn:
+        server, port = start_gunicorn(args.gunicorn)
+        mode, concurrency = f"gunicorn-{args.gunicorn}", args.concurrency
+        new_client = functools.partial(HTTPClient, port)
+    else:
+        mode, concurrency = "test_client", 1
+        new_client = functools.partial(TestClient, app, queries)
+
+    # No app context is pushed around the flows, so each test client request gets its own g and session
+    try:
+        run, email_address, setup_user_id = setup(app, new_client)
+        if args.members:
+            mode = f"{mode}-{args.members}-members"
+            with app.app_context():
+                add_members(setup_user_id, run, args.members)
+        selected = flows(new_client, run, email_address, setup_user_id)
+
+        results = {}
+        # Queries are only counted through the test client, so gunicorn runs have no queries column
+        columns = ["req/s", "p50 ms", "p95 ms", "p99 ms"] + ([] if args.gunicorn else ["queries"])
+        print(f"{'flow':<20}" + "".join(f" {column:>8}" for column in columns))
+        for name, (flow, expected) in selected.items():
+            result = results[name] = measure(flow, expected, args.requests, concurrency)
+            values = [result["throughput"], result["p50_ms"], result["p95_ms"], result["p99_ms"]]
+            values += [] if args.gunicorn else [result["queries"]]
+            print(f"{name:<20}" + "".join(f" {value:>8}" for value in values))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as baselines_file:
+            baselines = json.load(baselines_file)
+    if args.update:
+        baselines[mode] = results
+        with open(BASELINES, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+            baselines_file.write("\n")
+        print(f"Recorded {mode} baselines")
+        return 0
+
+    failures = compare(results, baselines.get(mode, {}), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Added latency per request from the default rate limits with each limiter storage.
+
+Usage: python benchmarks/rate_limit.py [redis://localhost:6379]
+
+Each request is checked against the app's default "2 per second" and "60 per minute" limits, as
+flask-limiter does. Without a Redis URL only the in-memory and degraded hybrid storages are measured.
+"""
+
+import statistics
+import sys
+import time
+
+from limits import parse_many
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.ratelimit import HybridStorage  # noqa: F401 registers the hybrid+redis:// storage scheme
+
+LIMITS = parse_many("2 per second; 60 per minute")
+REQUESTS = 5000
+
+
+def measure(uri, **options):
+    # The limiter only keeps a weak reference to its storage
+    storage = storage_from_string(uri, **options)
+    limiter = FixedWindowRateLimiter(storage)
+    timings = []
+    for request in range(REQUESTS):
+        # A spread of clients, so most requests are within their limits
+        client = str(request % 500)
+        start = time.perf_counter()
+        for item in LIMITS:
+            limiter.hit(item, client)
+        timings.append((time.perf_counter() - start) * 1000000)
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def main():
+    storages = [("memory", "memory://", {})]
+    if len(sys.argv) > 1:
+        storages.append(("redis", sys.argv[1], {}))
+        storages.append(("hybrid", "hybrid+" + sys.argv[1], {"sync_interval": 0.25}))
+    else:
+        storages.append(("hybrid (Redis down)", "hybrid+redis://localhost:1", {"sync_interval": 0.25}))
+
+    print(f"{'storage':<20} {'mean µs':>10} {'p50 µs':>10} {'p99 µs':>10}")
+    for name, uri, options in storages:
+        mean, p50, p99 = measure(uri, **options)
+        print(f"{name:<20} {mean:>10.1f} {p50:>10.1f} {p99:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
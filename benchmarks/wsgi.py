@@ -0,0 +1,3 @@
+from benchmarks.flows import make_app
+
+app = make_app()
@@ -0,0 +1,5 @@
+def post_fork(server, worker):
+    # With --preload the app is loaded, and may have connected to the database, before workers are forked
+    from app import database_pool
+
+    database_pool.dispose()
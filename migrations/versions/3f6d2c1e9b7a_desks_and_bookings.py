@@ -0,0 +1,61 @@
+"""desks and bookings
+
+Revision ID: 3f6d2c1e9b7a
+Revises: aa3b9a46fc13
+Create Date: 2026-10-18 09:12:41.218035
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "3f6d2c1e9b7a"
+down_revision = "aa3b9a46fc13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Required for the equality comparison on desk_id in the booking exclusion constraint
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.create_table(
+        "desk",
+        sa.Column("id", postgresql.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("organisation_id", postgresql.UUID(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["organisation_id"], ["organisation.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_desk_organisation_id"), "desk", ["organisation_id"], unique=False)
+    op.create_table(
+        "booking",
+        sa.Column("id", postgresql.UUID(), nullable=False),
+        sa.Column("desk_id", postgresql.UUID(), nullable=False),
+        sa.Column("user_id", postgresql.UUID(), nullable=False),
+        sa.Column("starts_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("ends_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint("starts_at < ends_at", name="ck_booking_period"),
+        postgresql.ExcludeConstraint(
+            (sa.column("desk_id"), "="),
+            (sa.text("tstzrange(starts_at, ends_at)"), "&&"),
+            name="ex_booking_desk_period",
+            using="gist",
+        ),
+        sa.ForeignKeyConstraint(["desk_id"], ["desk.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["user_account.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_booking_desk_id"), "booking", ["desk_id"], unique=False)
+    op.create_index(op.f("ix_booking_user_id"), "booking", ["user_id"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_booking_user_id"), table_name="booking")
+    op.drop_index(op.f("ix_booking_desk_id"), table_name="booking")
+    op.drop_table("booking")
+    op.drop_index(op.f("ix_desk_organisation_id"), table_name="desk")
+    op.drop_table("desk")
@@ -0,0 +1,33 @@
+"""member directory index
+
+Revision ID: 5e8b3d1a9c42
+Revises: c47e1b9d2f60
+Create Date: 2026-10-18 14:12:38.640215
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e8b3d1a9c42"
+down_revision = "c47e1b9d2f60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pages of an organisation's members in (name, id) order, built without blocking sign ups
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_account_organisation_id_name_id",
+            "user_account",
+            ["organisation_id", "name", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_account_organisation_id_name_id", table_name="user_account", postgresql_concurrently=True
+        )
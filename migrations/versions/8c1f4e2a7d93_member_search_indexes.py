@@ -0,0 +1,66 @@
+"""member search indexes
+
+Revision ID: 8c1f4e2a7d93
+Revises: 3f6d2c1e9b7a
+Create Date: 2026-10-18 10:04:17.532904
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c1f4e2a7d93"
+down_revision = "3f6d2c1e9b7a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Built concurrently outside the migration transaction, so sign ups and log ins aren't blocked on large tables.
+    # The prefix indexes use the "C" collation, under which a B-tree serves both LIKE 'x%' range scans and ORDER BY
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_account_organisation_id_name_prefix",
+            "user_account",
+            ["organisation_id", sa.text('lower(name) COLLATE "C"'), "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_user_account_organisation_id_email_address_prefix",
+            "user_account",
+            ["organisation_id", sa.text('lower(email_address) COLLATE "C"')],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_user_account_name_trgm",
+            "user_account",
+            [sa.text("lower(name) gin_trgm_ops")],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_user_account_email_address_trgm",
+            "user_account",
+            [sa.text("lower(email_address) gin_trgm_ops")],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_user_account_email_address_trgm", table_name="user_account", postgresql_concurrently=True)
+        op.drop_index("ix_user_account_name_trgm", table_name="user_account", postgresql_concurrently=True)
+        op.drop_index(
+            "ix_user_account_organisation_id_email_address_prefix",
+            table_name="user_account",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_user_account_organisation_id_name_prefix", table_name="user_account", postgresql_concurrently=True
+        )
@@ -0,0 +1,23 @@
+"""organisation deletion requested at
+
+Revision ID: c47e1b9d2f60
+Revises: 8c1f4e2a7d93
+Create Date: 2026-10-18 11:26:53.104716
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c47e1b9d2f60"
+down_revision = "8c1f4e2a7d93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("organisation", sa.Column("deletion_requested_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("organisation", "deletion_requested_at")
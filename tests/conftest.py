@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import Column
+from sqlalchemy.dialects.postgresql import UUID, ExcludeConstraint
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import create_app, db
+from config import Config
+
+CREATED_AT = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+@compiles(UUID, "sqlite")
+def compile_uuid(type_, compiler, **kw):
+    # SQLite has no UUID type, so ids are kept as text
+    return "TEXT"
+
+
+@compiles(ExcludeConstraint, "sqlite")
+def compile_exclude_constraint(constraint, compiler, **kw):
+    # Overlapping bookings are only prevented by Postgres
+    return None
+
+
+def create_tables(connection):
+    """Create the models' tables, and their indexes on plain columns, in a SQLite database."""
+    for table in db.metadata.sorted_tables:
+        connection.execute(CreateTable(table))
+        for index in table.indexes:
+            # Expression indexes with Postgres operator classes are left out
+            if all(isinstance(expression, Column) for expression in index.expressions):
+                connection.execute(CreateIndex(index))
+
+
+@pytest.fixture(autouse=True)
+def rate_limit_storage(monkeypatch):
+    # Keep rate limits in memory, so each test file runs on its own without REDIS_URL or a Redis server
+    monkeypatch.setattr(Config, "RATELIMIT_STORAGE_OPTIONS", {})
+    monkeypatch.setattr(Config, "RATELIMIT_STORAGE_URL", "memory://")
+    # Don't sweep for pending deletions in the background, as most test databases have no organisation table
+    monkeypatch.setattr(Config, "DELETION_SWEEP_INTERVAL", 0)
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """Make an app, with any config overrides, on a new SQLite database with the models' tables."""
+
+    def make(**config):
+        class TestConfig(Config):
+            PASSWORD_HASH_ROUNDS = 4
+            RATELIMIT_ENABLED = False
+            SECRET_KEY = "secret"
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path}/app.db"
+            WTF_CSRF_ENABLED = False
+
+        for name, value in config.items():
+            setattr(TestConfig, name, value)
+        app = create_app(TestConfig)
+        with app.app_context():
+            with db.engine.begin() as connection:
+                create_tables(connection)
+        return app
+
+    return make
+
+
+@pytest.fixture
+def add_organisation():
+    """Insert an organisation, in an app context, with its domain defaulting to <id>.example.org."""
+    from app.models import Organisation
+
+    def add(id, **values):
+        row = {"id": id, "name": id, "domain": f"{id}.example.org", "created_at": CREATED_AT, **values}
+        db.session.execute(Organisation.__table__.insert(), row)
+        db.session.commit()
+
+    return add
+
+
+@pytest.fixture
+def add_user():
+    """Insert a user, in an app context, with their name and email address defaulting to their id."""
+    from app.models import User
+
+    def add(id, organisation_id, **values):
+        row = {
+            "id": id,
+            "name": id,
+            "email_address": f"{id}@example.org",
+            "password": b"\x00",
+            "timezone": "UTC",
+            "organisation_id": organisation_id,
+            "role": "user",
+            "created_at": CREATED_AT,
+            **values,
+        }
+        db.session.execute(User.__table__.insert(), row)
+        db.session.commit()
+
+    return add
+
+
+@pytest.fixture
+def log_in():
+    """Log a test client in as a user, without going through the log in form."""
+
+    def log_in(test_client, user_id):
+        with test_client.session_transaction() as session:
+            session["_user_id"] = user_id
+            session["_fresh"] = True
+
+    return log_in
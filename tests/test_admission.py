@@ -0,0 +1,145 @@
+import pytest
+from flask_limiter.util import get_remote_address
+from limits.storage import MemoryStorage
+from werkzeug.exceptions import TooManyRequests
+
+from app import create_app, limiter, login_admission
+from app.admission import SlidingWindow
+from config import Config
+
+
+def make_app(**config):
+    class TestConfig(Config):
+        RATELIMIT_STORAGE_URL = "memory://"
+
+    for name, value in config.items():
+        setattr(TestConfig, name, value)
+    app = create_app(TestConfig)
+    limiter.storage.reset()
+    return app
+
+
+def test_sliding_window_weights_the_previous_window():
+    storage = MemoryStorage()
+    window = SlidingWindow("test", "10 per minute")
+    for _ in range(8):
+        window.hit(storage, "key", 59)
+
+    assert window.count(storage, "key", 59) == 8
+    assert window.count(storage, "key", 75) == 6
+    assert window.count(storage, "key", 120) == 0
+    # 8 * (1 - t / 60) + 1 < 10 for any t, so a 10th attempt would be admitted from 60 on
+    window.hit(storage, "key", 60)
+    assert window.retry_after(storage, "key", 60) == 1
+
+
+def test_sliding_window_retry_after_when_full():
+    storage = MemoryStorage()
+    window = SlidingWindow("test", "2 per minute")
+    window.hit(storage, "key", 10)
+    window.hit(storage, "key", 10)
+
+    assert window.retry_after(storage, "key", 10) == 50
+
+
+def test_attempts_from_an_ip_address_are_limited():
+    app = make_app(LOGIN_IP_LIMIT="2 per minute")
+
+    with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": "192.0.2.1"}):
+        for email_address in ("a@example.org", "b@example.org"):
+            with login_admission.attempt(email_address):
+                pass
+        shed = login_admission.counts["shed_ip"]
+        with pytest.raises(TooManyRequests) as error:
+            with login_admission.attempt("c@example.org"):
+                pass
+
+    assert login_admission.counts["shed_ip"] == shed + 1
+    assert dict(error.value.get_headers())["Retry-After"]
+    with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": "192.0.2.2"}):
+        with login_admission.attempt("c@example.org"):
+            pass
+
+
+def test_failed_attempts_for_an_account_are_limited():
+    app = make_app(LOGIN_ACCOUNT_LIMIT="2 per minute")
+
+    with app.test_request_context("/login", method="POST"):
+        with login_admission.attempt("ada@example.org"):
+            pass
+        login_admission.failed("Ada@example.org")
+        login_admission.failed("ada@example.org")
+        with pytest.raises(TooManyRequests):
+            with login_admission.attempt("ada@example.org"):
+                pass
+        with login_admission.attempt("grace@example.org"):
+            pass
+
+
+def test_failed_attempts_from_elsewhere_dont_lock_the_account_owner_out():
+    app = make_app(LOGIN_ACCOUNT_LIMIT="2 per minute")
+
+    with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": "192.0.2.1"}):
+        login_admission.failed("ada@example.org")
+        login_admission.failed("ada@example.org")
+        with pytest.raises(TooManyRequests):
+            with login_admission.attempt("ada@example.org"):
+                pass
+    with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": "192.0.2.2"}):
+        with login_admission.attempt("ada@example.org"):
+            pass
+
+
+def test_failed_attempts_for_an_account_from_many_addresses_are_limited():
+    app = make_app(LOGIN_ACCOUNT_LIMIT="2 per minute", LOGIN_ACCOUNT_TOTAL_LIMIT="3 per minute")
+
+    for address in ("192.0.2.1", "192.0.2.2", "192.0.2.3"):
+        with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": address}):
+            with login_admission.attempt("ada@example.org"):
+                pass
+            login_admission.failed("ada@example.org")
+    with app.test_request_context("/login", method="POST", environ_base={"REMOTE_ADDR": "192.0.2.4"}):
+        shed = login_admission.counts["shed_account"]
+        with pytest.raises(TooManyRequests):
+            with login_admission.attempt("ada@example.org"):
+                pass
+        assert login_admission.counts["shed_account"] == shed + 1
+        with login_admission.attempt("grace@example.org"):
+            pass
+
+
+def test_client_address_is_the_hop_added_by_the_trusted_proxy():
+    app = make_app()
+    app.add_url_rule("/address", "address", get_remote_address)
+
+    with app.test_client() as test_client:
+        response = test_client.get(
+            "/address",
+            base_url="https://localhost",
+            headers={"X-Forwarded-For": "203.0.113.1, 192.0.2.1"},
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        )
+
+    # Only the last hop was added by the router, earlier ones could be forged by the client
+    assert response.get_data(as_text=True) == "192.0.2.1"
+
+
+def test_attempts_beyond_the_hash_budget_are_shed():
+    app = make_app(LOGIN_HASH_BUDGET=1)
+
+    with app.test_request_context("/login", method="POST"):
+        with login_admission.attempt("ada@example.org"):
+            assert login_admission.in_flight == 1
+            with pytest.raises(TooManyRequests):
+                with login_admission.attempt("grace@example.org"):
+                    pass
+        assert login_admission.in_flight == 0
+
+
+def test_rate_limits_are_skipped_when_disabled():
+    app = make_app(RATELIMIT_ENABLED=False, LOGIN_IP_LIMIT="1 per minute")
+
+    with app.test_request_context("/login", method="POST"):
+        for _ in range(3):
+            with login_admission.attempt("ada@example.org"):
+                pass
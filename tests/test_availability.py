@@ -0,0 +1,46 @@
+from datetime import date, datetime, time
+
+import pytz
+
+from app.availability import AvailabilityIndex, DeskIntervals, day_bounds
+from app.recurrence import expand
+
+
+def at(hour, minute=0):
+    return datetime(2022, 8, 2, hour, minute, tzinfo=pytz.utc)
+
+
+def test_desk_intervals_conflicts():
+    intervals = DeskIntervals([(at(13), at(14)), (at(9), at(11))])
+    assert intervals.conflicts(at(10), at(12))
+    assert intervals.conflicts(at(8), at(18))
+    assert intervals.conflicts(at(13, 30), at(13, 45))
+    assert not intervals.conflicts(at(11), at(13))
+    assert not intervals.conflicts(at(14), at(17))
+    assert not intervals.conflicts(at(7), at(9))
+
+
+def test_availability_index_free_desks():
+    index = AvailabilityIndex(["a", "b", "c"], [("a", at(9), at(17)), ("b", at(9), at(12))])
+    assert index.free_desks(at(13), at(17)) == ["b", "c"]
+    assert index.free_desks(at(10), at(11)) == ["c"]
+    assert index.conflicts("a", at(16), at(18))
+
+
+def test_day_bounds_in_timezone():
+    starts_at, ends_at = day_bounds(date(2022, 8, 2), "Europe/London")
+    assert starts_at == datetime(2022, 8, 1, 23, tzinfo=pytz.utc)
+    assert ends_at == datetime(2022, 8, 2, 23, tzinfo=pytz.utc)
+
+
+def test_expand_weekly_recurrence():
+    # Tuesdays and Thursdays every other week, starting on a Wednesday
+    periods = expand(date(2022, 8, 3), date(2022, 8, 31), [1, 3], time(9), time(17), "Europe/London", interval=2)
+    assert [starts_at.date() for starts_at, _ in periods] == [
+        date(2022, 8, 4),
+        date(2022, 8, 16),
+        date(2022, 8, 18),
+        date(2022, 8, 30),
+    ]
+    assert periods[0][0] == datetime(2022, 8, 4, 8, tzinfo=pytz.utc)
+    assert periods[0][1] == datetime(2022, 8, 4, 16, tzinfo=pytz.utc)
@@ -0,0 +1,61 @@
+import functools
+
+import pytest
+from flask import g, has_app_context
+
+from app import deliverability
+from benchmarks import flows
+
+
+def test_measure_counts_requests_and_the_most_queries():
+    result = flows.measure(lambda iteration: (200, None, iteration % 3), 200, 20, 1)
+
+    assert result["requests"] == 20
+    assert result["queries"] == 2
+    assert 0 <= result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_measure_leaves_out_queries_when_they_are_not_counted():
+    result = flows.measure(lambda iteration: (302, "/", None), 302, 8, 4)
+
+    assert result["requests"] == 8
+    assert "queries" not in result
+
+
+def test_measure_fails_on_an_unexpected_status():
+    with pytest.raises(RuntimeError, match="Expected 302 but got 200"):
+        flows.measure(lambda iteration: (200, None, 1), 302, 1, 1)
+
+
+def test_compare_reports_regressions_against_the_baselines():
+    baselines = {"user.view": {"p95_ms": 10.0, "queries": 3}, "user.edit": {"p95_ms": 10.0, "queries": 5}}
+    results = {
+        "user.view": {"p95_ms": 11.9, "queries": 4},
+        "user.edit": {"p95_ms": 12.1, "queries": 5},
+        "user.login": {"p95_ms": 1.0},
+    }
+
+    assert flows.compare(results, baselines, 0.2) == [
+        "user.view made 4 queries per request, baseline is 3",
+        "user.edit p95 latency is 12.1ms, baseline is 10.0ms",
+        "user.login has no baseline, record one with --update",
+    ]
+    assert flows.compare({"user.view": {"p95_ms": 12.0, "queries": 3}}, baselines, 0.2) == []
+
+
+def test_test_client_flows_run_each_request_in_its_own_app_context(sqlite_app):
+    app = sqlite_app()
+    deliverability.positive.set(flows.DOMAIN, True)
+    left_in_g = []
+    # Look at g before the app's own before_request functions fill it in
+    app.before_request_funcs[None].insert(0, lambda: left_in_g.append(set(vars(g))))
+    new_client = functools.partial(flows.TestClient, app, flows.QueryCounter())
+
+    run, email_address, user_id = flows.setup(app, new_client)
+    assert not has_app_context()
+    for flow, expected in flows.flows(new_client, run, email_address, user_id).values():
+        flows.measure(flow, expected, 2, 1)
+
+    # Every request starts with an empty g, rather than the logged in user and session of the one before
+    assert len(left_in_g) > 12
+    assert set().union(*left_in_g) == set()
@@ -0,0 +1,81 @@
+import os
+
+from app import blocklist as app_blocklist
+from app import create_app
+from app.blocklist import DomainBlocklist, compile_entries
+from config import Config
+
+
+def make_blocklist(tmp_path, entries):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("\n".join(entries))
+    blocklist = DomainBlocklist()
+    blocklist.path = str(path)
+    blocklist.reload()
+    return blocklist, path
+
+
+def test_compile_entries():
+    suffixes, labels = compile_entries(["# comment", "", "Gmail", "mailinator.com  # disposable"])
+    assert suffixes == {"mailinator.com"}
+    assert labels == {"gmail"}
+
+
+def test_label_entries_match_whole_labels(tmp_path):
+    blocklist, _ = make_blocklist(tmp_path, ["live", "pm"])
+    assert blocklist.is_blocked("live.com")
+    assert blocklist.is_blocked("live.co.uk")
+    assert blocklist.is_blocked("pm.me")
+    assert not blocklist.is_blocked("olive.com")
+    assert not blocklist.is_blocked("example.pm")
+
+
+def test_label_entries_only_match_in_front_of_public_suffix(tmp_path):
+    blocklist, _ = make_blocklist(tmp_path, ["outlook"])
+    assert blocklist.is_blocked("outlook.co.uk")
+    assert blocklist.is_blocked("eu.outlook.com")
+    assert not blocklist.is_blocked("outlook.company.com")
+    assert not blocklist.is_blocked("outlook")
+
+
+def test_domain_entries_match_subdomains(tmp_path):
+    blocklist, _ = make_blocklist(tmp_path, ["mailinator.com"])
+    assert blocklist.is_blocked("mailinator.com")
+    assert blocklist.is_blocked("eu.Mailinator.com.")
+    assert not blocklist.is_blocked("notmailinator.com")
+
+
+def test_reloads_changed_file(tmp_path):
+    blocklist, path = make_blocklist(tmp_path, ["gmail"])
+    path.write_text("yahoo")
+    os.utime(path, (0, 0))
+    assert blocklist.reload()
+    assert blocklist.is_blocked("yahoo.com")
+    assert not blocklist.is_blocked("gmail.com")
+
+
+def test_loads_on_first_lookup(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("gmail")
+    blocklist = DomainBlocklist()
+    blocklist.path = str(path)
+    assert blocklist.entries == (frozenset(), frozenset())
+    assert blocklist.is_blocked("gmail.com")
+
+
+def test_missing_file_falls_back_to_bundled_blocklist(tmp_path, caplog):
+    class TestConfig(Config):
+        BLOCKLIST_PATH = str(tmp_path / "missing.txt")
+
+    app = create_app(TestConfig)
+
+    with app.app_context():
+        assert app_blocklist.is_blocked("gmail.com")
+        assert not app_blocklist.is_blocked("example.org")
+    assert sum("using the bundled blocklist" in message for message in caplog.messages) == 1
+
+    (tmp_path / "missing.txt").write_text("example.org")
+    app_blocklist._checked_at = float("-inf")
+    with app.app_context():
+        assert app_blocklist.is_blocked("example.org")
+        assert not app_blocklist.is_blocked("gmail.com")
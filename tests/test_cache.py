@@ -0,0 +1,46 @@
+import time
+
+from app import create_app
+from app.cache import TTLCache, dumps, loads, restore, snapshot
+from app.models import Organisation, User
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_user_snapshot_round_trip():
+    create_app()
+    organisation = Organisation(name="Mash", domain="mash.software")
+    user = User(
+        name="Ada Lovelace",
+        email_address="ada@mash.software",
+        password="password123",
+        timezone="Europe/London",
+        role="admin",
+    )
+    user.organisation_id = organisation.id
+
+    values = loads(User, dumps(snapshot(user)))
+    assert "password" not in values
+    assert values["created_at"] == user.created_at
+
+    restored = restore(User, values)
+    assert restored.id == user.id
+    assert restored.email_address == user.email_address
+    assert restored.organisation_id == organisation.id
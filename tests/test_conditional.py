@@ -0,0 +1,47 @@
+from app import create_app
+
+
+def get(test_client, path, **headers):
+    return test_client.get(path, base_url="https://localhost", headers=headers)
+
+
+def test_index_page_not_modified():
+    app = create_app()
+
+    with app.test_client() as test_client:
+        test_client.set_cookie("localhost", "cookies_policy", '{"functional": "no", "analytics": "no"}')
+        response = get(test_client, "/")
+        assert response.status_code == 200
+        assert response.headers["ETag"]
+        assert "Last-Modified" not in response.headers
+        assert "private" in response.headers["Cache-Control"]
+
+        etag = response.headers["ETag"]
+        response = get(test_client, "/", **{"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+        # If-Modified-Since alone can't show that nothing changed, so the page is rendered
+        response = get(test_client, "/", **{"If-Modified-Since": "Wed, 21 Oct 2099 07:28:00 GMT"})
+        assert response.status_code == 200
+
+
+def test_compressed_etag_not_modified():
+    app = create_app()
+
+    with app.test_client() as test_client:
+        test_client.set_cookie("localhost", "cookies_policy", '{"functional": "no", "analytics": "no"}')
+        etag = get(test_client, "/accessibility", **{"Accept-Encoding": "gzip"}).headers["ETag"]
+        assert etag.endswith(':gzip"')
+
+        response = get(test_client, "/accessibility", **{"If-None-Match": etag})
+        assert response.status_code == 304
+
+
+def test_no_etag_while_cookie_banner_is_shown():
+    app = create_app()
+
+    with app.test_client() as test_client:
+        response = get(test_client, "/privacy")
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app import db, domains, organisation_deleter
+from app.models import Booking, Desk
+
+
+@pytest.fixture
+def app(sqlite_app, add_organisation, add_user):
+    app = sqlite_app(DELETION_BATCH_SIZE=2, DELETION_BATCH_PAUSE=0)
+    created_at = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    with app.app_context():
+        for organisation in ("deleted", "kept"):
+            add_organisation(organisation)
+            for index in range(3):
+                id = f"{organisation}-{index}"
+                add_user(id, organisation)
+                db.session.execute(
+                    Desk.__table__.insert(),
+                    {"id": id, "name": "Desk", "organisation_id": organisation, "created_at": created_at},
+                )
+                db.session.execute(
+                    Booking.__table__.insert(),
+                    {
+                        "id": id,
+                        "desk_id": id,
+                        "user_id": id,
+                        "starts_at": created_at,
+                        "ends_at": datetime(2022, 1, 2, tzinfo=timezone.utc),
+                        "created_at": created_at,
+                    },
+                )
+        db.session.commit()
+    return app
+
+
+def request_deletion(app):
+    with app.app_context():
+        db.session.execute(
+            text("UPDATE organisation SET deletion_requested_at = '2022-01-02 00:00:00' WHERE id = 'deleted'")
+        )
+        db.session.commit()
+
+
+def test_organisation_is_deleted_in_batches(app):
+    with app.app_context():
+        assert organisation_deleter.progress("deleted") == {"bookings": 3, "desks": 3, "users": 3}
+        assert organisation_deleter.run("deleted")
+
+        assert organisation_deleter.progress("deleted") == {"bookings": 0, "desks": 0, "users": 0}
+        assert db.session.execute(text("SELECT id FROM organisation")).scalars().all() == ["kept"]
+        assert organisation_deleter.progress("kept") == {"bookings": 3, "desks": 3, "users": 3}
+
+
+def test_sweep_starts_pending_deletions(app, monkeypatch):
+    request_deletion(app)
+    started = []
+    monkeypatch.setattr(organisation_deleter, "start", started.append)
+
+    with app.app_context():
+        assert organisation_deleter.sweep() == ["deleted"]
+
+    assert started == ["deleted"]
+
+
+def test_members_of_organisations_being_deleted_only_see_its_progress(app, log_in, monkeypatch):
+    request_deletion(app)
+    monkeypatch.setattr(organisation_deleter, "start", lambda organisation_id: None)
+
+    with app.test_client() as test_client:
+        log_in(test_client, "deleted-0")
+
+        for url in ("/", "/users/00000000-0000-0000-0000-000000000000"):
+            response = test_client.get(url, base_url="https://localhost")
+            assert response.status_code == 302
+            assert response.location.endswith("/organisation/deletion")
+        assert test_client.get("/cookies", base_url="https://localhost").status_code == 200
+
+        log_in(test_client, "kept-0")
+        assert test_client.get("/", base_url="https://localhost").status_code == 200
+
+
+def test_organisations_being_deleted_only_own_their_domain_when_pending(app):
+    request_deletion(app)
+
+    with app.app_context():
+        assert domains.resolve("deleted.example.org") is None
+        assert domains.resolve("deleted.example.org", pending=True).id == "deleted"
+        assert domains.resolve("kept.example.org").id == "kept"
+
+
+def test_delete_pending_command(app):
+    request_deletion(app)
+
+    result = app.test_cli_runner().invoke(args=["organisations", "delete-pending"])
+
+    assert result.output == "Deleted organisation deleted\n"
+    with app.app_context():
+        assert db.session.execute(text("SELECT id FROM organisation")).scalars().all() == ["kept"]
+
+
+def test_previous_schema_without_deletion_requested_at(app, log_in, monkeypatch):
+    # Instances that don't run the migration serve this release against the previous schema until it finishes
+    with app.app_context():
+        db.session.execute(text("ALTER TABLE organisation DROP COLUMN deletion_requested_at"))
+        db.session.commit()
+        organisation_deleter.init_app(app)
+        monkeypatch.setattr(organisation_deleter, "start", lambda organisation_id: pytest.fail("started deleting"))
+
+        assert not organisation_deleter.ready()
+        assert organisation_deleter.sweep() == []
+        assert domains.resolve("deleted.example.org").id == "deleted"
+
+    with app.test_client() as test_client:
+        log_in(test_client, "deleted-0")
+        assert test_client.get("/", base_url="https://localhost").status_code == 200
+        assert test_client.get("/organisation/deletion", base_url="https://localhost").status_code == 302
+        # Cached users and organisations are used, without their deferred column
+        assert test_client.get("/", base_url="https://localhost").status_code == 200
@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+import dns.resolver
+import pytest
+from email_validator import EmailUndeliverableError
+
+from app import create_app
+from app.deliverability import DeliverabilityChecker
+
+MX = namedtuple("MX", ["preference", "exchange"])
+
+
+class StubResolver(object):
+    def __init__(self, domains):
+        self.domains = domains
+        self.queries = []
+
+    def resolve(self, domain, record):
+        self.queries.append((domain, record))
+        if domain not in self.domains:
+            raise dns.resolver.NXDOMAIN()
+        if record == "MX":
+            return [MX(10, f"mail.{domain}.")]
+        raise dns.resolver.NoAnswer()
+
+
+def make_checker(resolver):
+    app = create_app()
+    app.config["EMAIL_DNS_RESOLVER"] = resolver
+    return app, DeliverabilityChecker(app)
+
+
+def test_deliverable_domain_is_cached():
+    resolver = StubResolver(["mash.software"])
+    app, checker = make_checker(resolver)
+
+    with app.app_context():
+        checker.check("mash.software")
+        checker.check("MASH.software")
+
+    assert resolver.queries == [("mash.software", "MX"), ("mash.software", "TXT")]
+
+
+def test_undeliverable_domain_is_cached():
+    resolver = StubResolver([])
+    app, checker = make_checker(resolver)
+
+    with app.app_context():
+        for _ in range(2):
+            with pytest.raises(EmailUndeliverableError):
+                checker.check("does-not-exist.invalid")
+
+    assert len(resolver.queries) == 3
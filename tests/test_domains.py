@@ -0,0 +1,33 @@
+from app.domains import candidates, is_public_suffix, public_suffix
+
+
+def test_candidates_include_parent_domains():
+    assert candidates("UK.Example.com.") == ["uk.example.com", "example.com"]
+
+
+def test_candidates_exclude_top_level_domain():
+    assert candidates("example.com") == ["example.com"]
+    assert candidates("localhost") == ["localhost"]
+
+
+def test_candidates_without_subdomains():
+    assert candidates("uk.example.com", subdomains=False) == ["uk.example.com"]
+
+
+def test_candidates_stop_at_registrable_domain():
+    assert candidates("uk.bbc.co.uk") == ["uk.bbc.co.uk", "bbc.co.uk"]
+    assert candidates("bbc.co.uk") == ["bbc.co.uk"]
+
+
+def test_public_suffix_rules():
+    assert public_suffix("bbc.co.uk") == "co.uk"
+    assert public_suffix("example.unknowntld") == "unknowntld"
+    # *.ck makes every second level domain a suffix, except www.ck
+    assert public_suffix("shop.example.ck") == "example.ck"
+    assert public_suffix("www.ck") == "ck"
+
+
+def test_is_public_suffix():
+    assert is_public_suffix("co.uk")
+    assert is_public_suffix("COM.")
+    assert not is_public_suffix("bbc.co.uk")
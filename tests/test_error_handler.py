@@ -1,3 +1,5 @@
+from werkzeug.exceptions import TooManyRequests
+
 from app import create_app
 
 
@@ -17,3 +19,18 @@ def test_method_not_allowed():
         response = test_client.post("/")
         assert response.status_code == 405
         assert response.mimetype == "text/html"
+
+
+def test_error_headers_are_kept():
+    app = create_app()
+
+    @app.route("/busy")
+    def busy():
+        raise TooManyRequests(retry_after=30)
+
+    with app.test_client() as test_client:
+        response = test_client.get("/busy", base_url="https://localhost")
+        assert response.status_code == 429
+        # Flask-Limiter rewrites Retry-After as the later of its own reset and ours, in whole seconds
+        assert int(response.headers["Retry-After"]) in (29, 30)
+        assert response.mimetype == "text/html"
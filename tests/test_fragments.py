@@ -0,0 +1,49 @@
+from app import create_app
+from app.fragments import FragmentCache
+
+
+def make_app():
+    app = create_app()
+    cache = FragmentCache(app)
+    return app, cache
+
+
+def test_fragment_is_cached_until_key_changes():
+    app, cache = make_app()
+    template = app.jinja_env.from_string("{% cache key %}{{ counter.pop() }}{% endcache %}")
+
+    counter = [3, 2, 1]
+    assert template.render(key=1, counter=counter) == "1"
+    assert template.render(key=1, counter=counter) == "1"
+    assert template.render(key=2, counter=counter) == "2"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_cached_fragment_is_not_escaped_twice():
+    app, _ = make_app()
+    template = app.jinja_env.from_string("{% cache 1 %}{{ name }}{% endcache %}")
+
+    assert template.render(name="<b>") == "&lt;b&gt;"
+    assert template.render(name="<b>") == "&lt;b&gt;"
+
+
+def test_disabled_cache_always_renders():
+    app, cache = make_app()
+    cache.enabled = False
+    template = app.jinja_env.from_string("{% cache 1 %}{{ counter.pop() }}{% endcache %}")
+
+    counter = [2, 1]
+    assert template.render(counter=counter) == "1"
+    assert template.render(counter=counter) == "2"
+
+
+def test_index_page_renders_cached_navigation():
+    app, cache = make_app()
+
+    with app.test_client() as test_client:
+        for _ in range(2):
+            response = test_client.get("/", base_url="https://localhost")
+            assert response.status_code == 200
+            assert b"Log in" in response.data
+    assert cache.stats()["hits"] == 1
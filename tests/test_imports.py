@@ -0,0 +1,156 @@
+import csv
+import io
+
+import bcrypt
+import pytest
+from sqlalchemy import text
+
+from app import db, deliverability
+from app.imports import RowError, UserImport, read_rows, write_csv
+
+
+class FakeImport(UserImport):
+    def organisation_for(self, domain):
+        return "org" if domain == "example.org" else None
+
+
+@pytest.fixture
+def app(sqlite_app, add_organisation, add_user):
+    app = sqlite_app()
+    with app.app_context():
+        add_organisation("org", name="Org", domain="example.org")
+        add_user("admin", "org", role="admin")
+        add_user("taken", "org")
+    # Skip the DNS lookup for the organisation's domain
+    deliverability.positive.set("example.org", True)
+    return app
+
+
+def test_csv_rows_are_read_with_line_numbers():
+    upload = io.BytesIO(
+        b'\xef\xbb\xbfname,email_address\r\nAda,ada@example.org\r\n"Grace\r\nHopper",grace@example.org\r\n'
+    )
+
+    assert list(read_rows(upload)) == [
+        (2, {"name": "Ada", "email_address": "ada@example.org"}),
+        (4, {"name": "Grace\r\nHopper", "email_address": "grace@example.org"}),
+    ]
+
+
+def test_json_lines_that_cant_be_read_are_none():
+    upload = io.BytesIO(b'{"name": "Ada"}\n\nnot json\n["list"]\n')
+
+    assert list(read_rows(upload, "jsonl")) == [(1, {"name": "Ada"}), (3, None), (4, None)]
+
+
+def test_rows_that_arent_utf8_are_none():
+    upload = io.BytesIO(b'name,email_address\nAd\xe9,ada@example.org\n"Grace\n\xffHopper",grace@example.org\nBob,b@x\n')
+
+    assert list(read_rows(upload)) == [(2, None), (4, None), (5, {"name": "Bob", "email_address": "b@x"})]
+    assert list(read_rows(io.BytesIO(b'{"name": "Ad\xe9"}\n{"name": "Bob"}\n'), "jsonl")) == [
+        (1, None),
+        (2, {"name": "Bob"}),
+    ]
+
+
+def test_rows_after_a_nul_byte_are_read():
+    upload = io.BytesIO(b"name,email_address\nAda\x00,ada@example.org\nBob,b@x\n")
+
+    assert list(read_rows(upload))[-1] == (3, {"name": "Bob", "email_address": "b@x"})
+
+
+def test_report_is_written_a_line_at_a_time():
+    assert list(write_csv([("line", "status"), (2, "has, comma")])) == ["line,status\r\n", '2,"has, comma"\r\n']
+
+
+def test_valid_row_gets_generated_password():
+    user = FakeImport("org", timezone="Europe/London").validate({"name": " Ada ", "email_address": "Ada@example.org"})
+
+    assert user["name"] == "Ada"
+    assert user["email_address"] == "ada@example.org"
+    assert user["timezone"] == "Europe/London"
+    assert user["role"] == "user"
+    password, generated = user["password"]
+    assert password == generated and len(password) >= 8
+
+
+@pytest.mark.parametrize(
+    "row, message",
+    [
+        (None, "Row could not be read"),
+        ({"email_address": "ada@example.org"}, "Enter a name"),
+        ({"name": "Ada", "email_address": "ada"}, "must have exactly one @-sign"),
+        ({"name": "Ada", "email_address": "ada@example.com"}, "organisation's domains"),
+        ({"name": "Ada", "email_address": "ada@example.org", "timezone": "Mars"}, "Mars is not a recognised"),
+        ({"name": "Ada", "email_address": "ada@example.org", "role": "owner"}, "Role must be"),
+        ({"name": "Ada", "email_address": "ada@example.org", "password": "short"}, "between 8 and 72"),
+    ],
+)
+def test_invalid_rows(row, message):
+    with pytest.raises(RowError, match=message):
+        FakeImport("org").validate(row)
+
+
+def test_duplicate_rows():
+    user_import = FakeImport("org")
+    user_import.validate({"name": "Ada", "email_address": "ada@example.org"})
+
+    with pytest.raises(RowError, match="more than once"):
+        user_import.validate({"name": "Ada", "email_address": "ADA@example.org"})
+
+
+def test_chunk_skips_existing_accounts(app):
+    with app.app_context():
+        chunk = [
+            (2, {"name": "Ada", "email_address": "ada@example.org", "password": "correct horse"}),
+            (3, {"name": "Taken", "email_address": "taken@example.org"}),
+            (4, None),
+        ]
+        user_import = UserImport("org")
+        report = list(user_import.import_chunk(chunk))
+
+        assert [row[:4] for row in report] == [
+            (2, "ada@example.org", "imported", ""),
+            (3, "taken@example.org", "skipped", "Email address already has an account"),
+            (4, "", "error", "Row could not be read"),
+        ]
+        assert user_import.counts == {"imported": 1, "skipped": 1, "error": 1}
+        password = db.session.execute(
+            text("SELECT password FROM user_account WHERE email_address = 'ada@example.org'")
+        ).scalar()
+        assert bcrypt.checkpw(b"correct horse", password)
+        assert db.session.execute(text("SELECT name FROM user_account WHERE id = 'taken'")).scalar() == "taken"
+
+
+def test_import_streams_a_report(app, log_in):
+    with app.test_client() as test_client:
+        log_in(test_client, "admin")
+        upload = b"name,email_address\nAda,ada@example.org\nTaken,taken@example.org\nOther,o@example.com\n"
+        response = test_client.post(
+            "/organisation/users/import",
+            data={"file": (io.BytesIO(upload), "users.csv")},
+            base_url="https://localhost",
+        )
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/csv"
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [(row["line"], row["status"]) for row in rows] == [
+            ("2", "imported"),
+            ("3", "skipped"),
+            ("4", "error"),
+            ("", "summary"),
+        ]
+        assert len(rows[0]["initial_password"]) >= 8
+        assert rows[3]["message"].startswith("1 imported, 1 already had accounts and 1 had errors")
+
+
+def test_only_admins_can_import(app, log_in):
+    with app.test_client() as test_client:
+        log_in(test_client, "taken")
+        response = test_client.post(
+            "/organisation/users/import",
+            data={"file": (io.BytesIO(b"name,email_address\n"), "users.csv")},
+            base_url="https://localhost",
+        )
+        assert response.status_code == 403
@@ -0,0 +1,73 @@
+import io
+import json
+import logging
+import sys
+
+from app import create_app
+from app.logs import DroppingQueueHandler, JSONFormatter, SamplingFilter
+
+
+def test_request_is_logged_as_json_with_request_id():
+    app = create_app()
+    stream = io.StringIO()
+    handler = app.extensions["request_logging"].handler
+    handler.handler.stream = stream
+
+    response = app.test_client().get("/", base_url="https://localhost", headers={"X-Request-ID": "abc123"})
+    handler.stop()
+
+    assert response.headers["X-Request-ID"] == "abc123"
+    entry = json.loads(stream.getvalue().splitlines()[-1])
+    assert entry["message"] == "GET / 200"
+    assert entry["request_id"] == "abc123"
+    assert entry["endpoint"] == "main.index"
+    assert entry["status"] == 200
+    assert entry["duration_ms"] >= 0
+
+
+def test_invalid_request_id_is_replaced():
+    app = create_app()
+    client = app.test_client()
+
+    for request_id in ("x" * 201, "abc 123", "abc\u00e9", ""):
+        response = client.get("/", base_url="https://localhost", headers={"X-Request-ID": request_id})
+        assert response.headers["X-Request-ID"] != request_id
+        assert len(response.headers["X-Request-ID"]) == 32
+    app.extensions["request_logging"].stop()
+
+
+def test_full_queue_drops_records():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    handler = DroppingQueueHandler(target, maxsize=2)
+    # Stop the listener draining the queue, so it fills up
+    handler._pid = -1
+    handler.start = lambda: None
+    logger = logging.getLogger("test_full_queue_drops_records")
+    logger.addHandler(handler)
+
+    for number in range(5):
+        logger.warning(f"Record {number}")
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_sampling_only_drops_marked_info_records():
+    sampling = SamplingFilter(rate=0.0)
+
+    assert not sampling.filter(logging.makeLogRecord({"levelno": logging.INFO, "sample": True}))
+    assert sampling.filter(logging.makeLogRecord({"levelno": logging.ERROR, "sample": True}))
+    assert sampling.filter(logging.makeLogRecord({"levelno": logging.INFO}))
+
+
+def test_exceptions_are_included():
+    handler = DroppingQueueHandler(logging.NullHandler())
+    try:
+        raise ValueError("Broken")
+    except ValueError:
+        record = logging.makeLogRecord({"msg": "Failed %s", "args": ("job",), "exc_info": sys.exc_info()})
+
+    entry = json.loads(JSONFormatter().format(handler.prepare(record)))
+    assert entry["message"] == "Failed job"
+    assert "ValueError: Broken" in entry["exception"]
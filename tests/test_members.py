@@ -0,0 +1,83 @@
+import json
+import uuid
+
+import pytest
+
+from app.members import decode_cursor, encode_cursor, export_rows, iter_members, page, write_json
+
+
+def member_id(index):
+    return str(uuid.UUID(int=index))
+
+
+@pytest.fixture
+def app(sqlite_app, add_user):
+    app = sqlite_app()
+    with app.app_context():
+        for index, name in enumerate(["Cat", "Ada", "Bob", "Ada", "Dee"]):
+            add_user(member_id(index), "org", name=name, email_address=f"{index}@example.org")
+        add_user(member_id(99), "other", name="Aaron", email_address="a@example.com")
+    return app
+
+
+def test_pages_follow_name_then_id(app):
+    with app.app_context():
+        first, cursor = page("org", size=2)
+        assert [row.id for row in first] == [member_id(1), member_id(3)]
+        assert decode_cursor(cursor) == ("Ada", member_id(3))
+
+        second, cursor = page("org", decode_cursor(cursor), size=2)
+        assert [row.name for row in second] == ["Bob", "Cat"]
+
+        last, cursor = page("org", decode_cursor(cursor), size=2)
+        assert [row.name for row in last] == ["Dee"]
+        assert cursor is None
+
+
+def test_export_streams_every_member_in_batches(app):
+    with app.app_context():
+        members = list(iter_members("org", batch_size=2))
+        assert [row.id for row in members] == [member_id(index) for index in (1, 3, 2, 0, 4)]
+        assert not hasattr(members[0], "password")
+
+        rows = list(export_rows(members[:1]))
+        assert rows == [
+            ("id", "name", "email_address", "role", "timezone", "created_at", "login_at"),
+            (member_id(1), "Ada", "1@example.org", "user", "UTC", "2022-01-01T00:00:00", ""),
+        ]
+        assert [item["id"] for item in json.loads("".join(write_json(members)))] == [row.id for row in members]
+
+
+def test_members_are_listed_by_name(app, add_organisation, log_in):
+    with app.app_context():
+        add_organisation("org")
+
+    with app.test_client() as test_client:
+        log_in(test_client, member_id(0))
+        response = test_client.get("/organisation/users", base_url="https://localhost")
+
+    assert response.status_code == 200
+    assert "Dee" in response.get_data(as_text=True)
+    assert "Aaron" not in response.get_data(as_text=True)
+
+
+def test_users_without_an_organisation_cant_list_members(app, add_user, log_in):
+    with app.app_context():
+        add_user(member_id(100), None, name="Stranger", email_address="stranger@elsewhere.com")
+        add_user(member_id(101), None, name="Nomad", email_address="nomad@elsewhere.com")
+
+    with app.test_client() as test_client:
+        log_in(test_client, member_id(100))
+        response = test_client.get("/organisation/users", base_url="https://localhost")
+
+    assert response.status_code == 403
+
+
+def test_empty_json_export():
+    assert json.loads("".join(write_json([]))) == []
+
+
+def test_invalid_cursors_are_ignored():
+    assert decode_cursor("not a cursor") is None
+    assert decode_cursor(encode_cursor(type("Row", (), {"name": 1, "id": member_id(1)}))) is None
+    assert decode_cursor(encode_cursor(type("Row", (), {"name": "Ada", "id": "1' OR '1"}))) is None
@@ -0,0 +1,90 @@
+import re
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from app.metrics import Histogram, collapse
+from config import Config
+
+
+class MetricsConfig(Config):
+    METRICS_TOKEN = "secret"
+
+
+def test_histogram_exposes_cumulative_buckets():
+    histogram = Histogram("request_seconds", "Time to handle a request.", ("endpoint",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "main.index")
+    histogram.observe(0.5, "main.index")
+    histogram.observe(5, "main.index")
+
+    assert histogram.expose() == [
+        "# HELP request_seconds Time to handle a request.",
+        "# TYPE request_seconds histogram",
+        'request_seconds_bucket{endpoint="main.index",le="0.1"} 1',
+        'request_seconds_bucket{endpoint="main.index",le="1.0"} 2',
+        'request_seconds_bucket{endpoint="main.index",le="+Inf"} 3',
+        'request_seconds_sum{endpoint="main.index"} 5.55',
+        'request_seconds_count{endpoint="main.index"} 3',
+    ]
+
+
+def test_metrics_endpoint_needs_token():
+    app = create_app(MetricsConfig)
+    client = app.test_client()
+    client.get("/privacy", base_url="https://localhost")
+
+    assert client.get("/metrics", base_url="https://localhost").status_code == 404
+    response = client.get("/metrics", base_url="https://localhost", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    # Metrics are kept per process, so other tests' requests may be counted too
+    assert re.search(
+        r'http_request_duration_seconds_count\{endpoint="main.privacy",method="GET",status="200"\} \d+', body
+    )
+    assert re.search(r'template_render_seconds_count\{template="privacy.html"\} \d+', body)
+    assert re.search(r'login_attempts_total\{outcome="shed_budget"\} \d+', body)
+    assert "login_password_checks_in_flight 0" in body
+
+
+def test_metrics_endpoint_is_not_registered_without_token():
+    app = create_app()
+
+    assert "metrics" not in app.view_functions
+
+
+def test_collapse_lists_stack_from_root():
+    def inner():
+        import sys
+
+        return collapse(sys._getframe())
+
+    assert inner().endswith(f"{__name__}:test_collapse_lists_stack_from_root;{__name__}:inner")
+
+
+def test_failed_statement_does_not_leak_start_time():
+    # Registers the query timing listeners on every engine
+    create_app(MetricsConfig)
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        assert connection.info["query_started"] == []
+
+
+def test_profiler_stops_when_request_raises():
+    class ProfileConfig(Config):
+        PROFILE_SLOW_REQUEST_MS = 10000
+        # Raise out of the test client, which skips after_request
+        PROPAGATE_EXCEPTIONS = True
+
+    app = create_app(ProfileConfig)
+
+    @app.route("/raises")
+    def raises():
+        raise RuntimeError("raised")
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get("/raises", base_url="https://localhost")
+    assert app.extensions["metrics"].profiler.active == {}
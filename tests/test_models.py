@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+import pytest
+
+from app.models import Organisation, OrganisationStatistics
+from app.timezones import utcnow
+
+
+@pytest.fixture
+def app(sqlite_app, add_organisation, add_user):
+    app = sqlite_app()
+    now = utcnow()
+    with app.app_context():
+        add_organisation("org")
+        add_organisation("other")
+        add_user("admin", "org", role="admin", login_at=now - timedelta(days=1))
+        add_user("recent", "org", login_at=now - timedelta(days=6))
+        add_user("lapsed", "org", login_at=now - timedelta(days=40))
+        add_user("never", "org")
+        add_user("elsewhere", "other", role="admin", login_at=now)
+    return app
+
+
+def test_organisation_statistics(app):
+    with app.app_context():
+        organisation = Organisation.query.get("org")
+
+        assert organisation.statistics() == OrganisationStatistics(users=4, admins=1, recent_logins=2, recent_days=30)
+        assert organisation.statistics(recent_days=5) == OrganisationStatistics(
+            users=4, admins=1, recent_logins=1, recent_days=5
+        )
+        assert Organisation.query.get("other").statistics() == OrganisationStatistics(1, 1, 1, 30)
+
+
+def test_organisation_page_shows_statistics(app, log_in):
+    with app.test_client() as test_client:
+        log_in(test_client, "recent")
+        response = test_client.get("/organisation/", base_url="https://localhost")
+
+    assert response.status_code == 200
+    assert "2 in the last 30 days" in response.get_data(as_text=True)
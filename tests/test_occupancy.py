@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from app.occupancy import OccupancyBitmap, OccupancyCache
+
+DAY = datetime(2022, 8, 2, tzinfo=pytz.utc)
+
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+
+def test_heatmap_and_free_count():
+    bitmap = OccupancyBitmap(["a", "b", "c"], DAY, DAY + timedelta(days=1), [("a", at(9), at(10))])
+    bitmap.add("b", at(9, 30), at(9, 40))
+
+    heatmap = bitmap.heatmap()
+    assert len(heatmap) == 96
+    assert heatmap[36:40] == [1, 1, 2, 1]
+    assert sum(heatmap) == 5
+    assert bitmap.free_count(at(9, 30), at(9, 45)) == 1
+    assert bitmap.free_desks(at(9), at(9, 15)) == ["b", "c"]
+
+
+def test_remove_keeps_other_bookings_in_shared_slot():
+    bitmap = OccupancyBitmap(["a"], DAY, DAY + timedelta(days=1))
+    bitmap.add("a", at(9), at(9, 10))
+    bitmap.add("a", at(9, 10), at(9, 20))
+    bitmap.remove("a", at(9), at(9, 10))
+
+    assert bitmap.heatmap()[36:38] == [1, 1]
+    bitmap.remove("a", at(9, 10), at(9, 20))
+    assert sum(bitmap.heatmap()) == 0
+
+
+def test_bookings_are_clipped_to_the_day():
+    bitmap = OccupancyBitmap(["a"], DAY, DAY + timedelta(days=1))
+    bitmap.add("a", at(-2), at(1))
+    assert bitmap.heatmap()[:5] == [1, 1, 1, 1, 0]
+
+
+def test_cache_keeps_at_most_days_per_organisation(monkeypatch):
+    monkeypatch.setattr(
+        OccupancyBitmap, "load_day", classmethod(lambda cls, organisation_id, day, timezone: cls(["a"], day, day))
+    )
+    cache = OccupancyCache()
+    cache.days = 2
+    for offset in range(3):
+        cache.get("org", DAY + timedelta(days=offset))
+
+    assert len(cache.cache.get("org")) == 2
+    cache.booked("org", "a", [(at(9), at(10))])
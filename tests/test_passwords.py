@@ -0,0 +1,56 @@
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.passwords import PasswordHasher, calibrate, rounds_from_hash
+
+
+def test_hash_and_check():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    hashed_password = hasher.hash("correct horse")
+    assert rounds_from_hash(hashed_password) == 4
+    assert hasher.check("correct horse", hashed_password)
+    assert not hasher.check("battery staple", hashed_password)
+
+
+def test_needs_rehash_only_when_cost_increases():
+    hasher = PasswordHasher()
+    hasher.rounds = 5
+    hashed_password = hasher.hash("correct horse")
+    assert not hasher.needs_rehash(hashed_password)
+    hasher.rounds = 6
+    assert hasher.needs_rehash(hashed_password)
+    hasher.rounds = 4
+    assert not hasher.needs_rehash(hashed_password)
+
+
+def test_calibrate_respects_minimum():
+    assert calibrate(0.001, min_rounds=6, probe_rounds=4, probes=3) == 6
+
+
+def test_sheds_load_when_queue_is_full():
+    hasher = PasswordHasher()
+    hasher.queue_timeout = 0.01
+    while hasher._slots.acquire(blocking=False):
+        pass
+    with pytest.raises(ServiceUnavailable):
+        hasher.hash("correct horse")
+
+
+def test_check_dummy_never_matches():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    assert hasher.check_dummy("correct horse") is False
+    assert rounds_from_hash(hasher._dummy_hash) == 4
+
+
+def test_hash_many_frees_its_slots():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    hashed_passwords = hasher.hash_many(["correct horse", "battery staple", "staple horse"])
+
+    assert hasher.check("battery staple", hashed_passwords[1])
+    assert not hasher.check("correct horse", hashed_passwords[1])
+    # Slots are released by callbacks on the pool's threads, which have all run once it has shut down
+    hasher._executor.shutdown(wait=True)
+    assert hasher._slots._value == hasher.workers
@@ -0,0 +1,34 @@
+import brotli
+
+from app import create_app
+from app.precompress import precompress
+
+
+def test_precompress_writes_siblings(tmp_path):
+    (tmp_path / "dist" / "js").mkdir(parents=True)
+    (tmp_path / "dist" / "js" / "custom-1234.min.js").write_bytes(b"console.log('hello');" * 10)
+
+    manifest = precompress(str(tmp_path))
+
+    assert manifest == {"dist/js/custom-1234.min.js": ["br", "gzip"]}
+    compressed = (tmp_path / "dist" / "js" / "custom-1234.min.js.br").read_bytes()
+    assert brotli.decompress(compressed) == b"console.log('hello');" * 10
+    assert (tmp_path / "dist" / "js" / "custom-1234.min.js.gz").exists()
+
+
+def test_serves_precompressed_asset(tmp_path):
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "custom-1234.min.css").write_bytes(b"body{margin:0}" * 100)
+    app = create_app()
+    app.static_folder = str(tmp_path)
+    app.extensions["precompressed_static"].manifest = precompress(str(tmp_path))
+
+    with app.test_client() as test_client:
+        response = test_client.get(
+            "/static/dist/custom-1234.min.css", base_url="https://localhost", headers={"Accept-Encoding": "gzip, br"}
+        )
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "br"
+        assert response.mimetype == "text/css"
+        assert "immutable" in response.headers["Cache-Control"]
+        assert brotli.decompress(response.data) == b"body{margin:0}" * 100
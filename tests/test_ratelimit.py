@@ -0,0 +1,141 @@
+import redis
+
+from app.ratelimit import HybridStorage
+
+
+class FakePipeline(object):
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return command
+
+    def execute(self):
+        results = []
+        for name, args, kwargs in self.commands:
+            key = args[0]
+            if name == "set":
+                results.append(self.store.setdefault(key, args[1]) == args[1])
+            elif name == "incrby":
+                self.store[key] = self.store.get(key, 0) + args[1]
+                results.append(self.store[key])
+            elif name == "get":
+                results.append(str(self.store[key]).encode() if key in self.store else None)
+            elif name == "expire":
+                results.append(key in self.store)
+            elif name == "pttl":
+                results.append(30000 if key in self.store else -2)
+        return results
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.store = {}
+        self.pipelines = []
+
+    def pipeline(self, transaction=True):
+        self.pipelines.append(FakePipeline(self.store))
+        return self.pipelines[-1]
+
+
+class DownPipeline(FakePipeline):
+    def execute(self):
+        raise redis.ConnectionError("Connection refused")
+
+
+class DownRedis(FakeRedis):
+    def pipeline(self, transaction=True):
+        return DownPipeline(self.store)
+
+
+def make_storage(client):
+    storage = HybridStorage("hybrid+redis://localhost:6379", sync_interval=60)
+    storage.redis = client
+    return storage
+
+
+def test_hits_are_counted_locally_and_synced_in_a_batch():
+    client = FakeRedis()
+    storage = make_storage(client)
+
+    assert [storage.incr("LIMITER/a", 60) for _ in range(3)] == [1, 2, 3]
+    assert client.store == {}
+
+    storage.sync()
+    assert client.store == {"LIMITER/a": 3}
+    assert storage.get("LIMITER/a") == 3
+
+
+def test_sync_pulls_back_hits_from_other_processes():
+    client = FakeRedis()
+    first, second = make_storage(client), make_storage(client)
+
+    first.incr("LIMITER/a", 60)
+    second.incr("LIMITER/a", 60)
+    second.incr("LIMITER/a", 60)
+    first.sync()
+    second.sync()
+    first.incr("LIMITER/a", 60)
+    first.sync()
+
+    assert first.get("LIMITER/a") == 4
+    assert second.get("LIMITER/a") == 3
+
+
+def test_only_windows_with_new_hits_or_not_yet_synced_are_sent():
+    client = FakeRedis()
+    storage = make_storage(client)
+
+    storage.incr("LIMITER/a", 60)
+    storage.sync()
+    storage.incr("LIMITER/b", 60)
+    storage.sync()
+    storage.sync()
+
+    assert [{args[0] for _, args, _ in pipeline.commands} for pipeline in client.pipelines] == [
+        {"LIMITER/a"},
+        {"LIMITER/b"},
+    ]
+
+
+def test_new_window_is_seeded_from_redis_on_the_next_sync():
+    client = FakeRedis()
+    client.store["LIMITER/a"] = 59
+    storage = make_storage(client)
+
+    assert storage.incr("LIMITER/a", 60) == 1
+    assert storage._wake.is_set()
+    storage.sync()
+    assert storage.get("LIMITER/a") == 60
+
+
+def test_elastic_expiry_is_extended_in_redis():
+    client = FakeRedis()
+    storage = make_storage(client)
+
+    storage.incr("LIMITER/a", 60)
+    storage.incr("LIMITER/b", 60, elastic_expiry=True)
+    storage.sync()
+
+    expired = [args for name, args, _ in client.pipelines[0].commands if name == "expire"]
+    assert expired == [("LIMITER/b", 60)]
+    assert storage.get("LIMITER/b") == 1
+
+
+def test_limits_are_enforced_locally_while_redis_is_down():
+    storage = make_storage(DownRedis())
+
+    assert [storage.incr("LIMITER/a", 60) for _ in range(2)] == [1, 2]
+    storage.sync()
+    assert storage.degraded
+    assert storage.incr("LIMITER/a", 60) == 3
+
+    storage.redis = FakeRedis()
+    storage.sync()
+    assert not storage.degraded
+    assert storage.redis.store == {"LIMITER/a": 3}
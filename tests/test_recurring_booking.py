@@ -0,0 +1,49 @@
+import pytest
+
+from app import db
+from app.models import Desk
+
+DESK_ID = "00000000-0000-0000-0000-000000000001"
+URL = f"/organisation/desks/{DESK_ID}/bookings/recurring"
+
+
+@pytest.fixture
+def app(sqlite_app, add_organisation, add_user):
+    app = sqlite_app()
+    with app.app_context():
+        add_organisation("org")
+        add_user("ada", "org")
+        desk = Desk("Window", "org")
+        desk.id = DESK_ID
+        db.session.add(desk)
+        db.session.commit()
+    return app
+
+
+def test_recurring_booking_form(app, log_in):
+    with app.test_client() as test_client:
+        log_in(test_client, "ada")
+        response = test_client.get(URL, base_url="https://localhost")
+
+    assert response.status_code == 200
+    assert "Book Window" in response.get_data(as_text=True)
+
+
+def test_invalid_recurring_booking_shows_errors(app, log_in):
+    with app.test_client() as test_client:
+        log_in(test_client, "ada")
+        response = test_client.post(
+            URL,
+            data={
+                "starts_on": "2022-08-10",
+                "until": "2022-08-03",
+                "starts_at": "09:00",
+                "ends_at": "17:00",
+                "weekdays": ["1"],
+                "interval": "1",
+            },
+            base_url="https://localhost",
+        )
+
+    assert response.status_code == 200
+    assert "Last day must be on or after the first day" in response.get_data(as_text=True)
@@ -0,0 +1,117 @@
+import pytest
+
+from app import member_search
+
+
+@pytest.fixture
+def make_app(sqlite_app, add_user):
+    def make(**config):
+        app = sqlite_app(**config)
+        with app.app_context():
+            for id, name, email_address, organisation_id in [
+                ("1", "Ada Lovelace", "ada@example.org", "org"),
+                ("2", "Adam Smith", "smith@example.org", "org"),
+                ("3", "Grace Hopper", "admiral@example.org", "org"),
+                ("4", "Alan Turing", "alan@example.org", "org"),
+                ("5", "Adele Other", "adele@example.com", "other"),
+                ("6", "50% Off", "sale@example.org", "org"),
+            ]:
+                add_user(id, organisation_id, name=name, email_address=email_address)
+        return app
+
+    return make
+
+
+def names(results):
+    return [result.name for result in results]
+
+
+def test_prefix_of_name_or_email_address_in_name_order(make_app):
+    app = make_app()
+
+    with app.app_context():
+        assert names(member_search.search("org", "AD")) == ["Ada Lovelace", "Adam Smith", "Grace Hopper"]
+        assert names(member_search.search("org", "ada  l")) == ["Ada Lovelace"]
+        assert names(member_search.search("org", "ad", limit=1)) == ["Ada Lovelace"]
+        assert names(member_search.search("org", "50%")) == ["50% Off"]
+        assert member_search.search("org", "  ") == []
+
+
+def test_longer_prefixes_are_filtered_from_a_complete_shorter_one(make_app, monkeypatch):
+    app = make_app()
+
+    with app.app_context():
+        member_search.search("org", "a")
+        monkeypatch.setattr(member_search, "_query_prefix", None)
+        assert names(member_search.search("org", "ad")) == ["Ada Lovelace", "Adam Smith", "Grace Hopper"]
+        assert names(member_search.search("org", "adam")) == ["Adam Smith"]
+
+
+def test_incomplete_prefixes_are_queried_again(make_app):
+    app = make_app(SEARCH_CACHE_ROWS=1)
+
+    with app.app_context():
+        assert names(member_search.search("org", "a")) == ["Ada Lovelace"]
+        assert names(member_search.search("org", "al")) == ["Alan Turing"]
+
+
+def test_email_address_matches_are_kept_in_name_order(make_app, add_user):
+    app = make_app(SEARCH_CACHE_ROWS=1)
+
+    with app.app_context():
+        for id, name, email_address in [("7", "Dan", "ax@example.org"), ("8", "Cat", "ay@example.org")]:
+            add_user(id, "letters", name=name, email_address=email_address)
+        add_user("9", "letters", name="Bea", email_address="az@example.org")
+        assert names(member_search.search("letters", "a", limit=1)) == ["Bea"]
+
+
+def test_cached_prefixes_are_limited_per_organisation(make_app):
+    app = make_app(SEARCH_CACHE_PREFIXES=2)
+
+    with app.app_context():
+        for query in ("x", "y", "z"):
+            member_search.search("org", query)
+        assert len(member_search.cache.get("org")) == 2
+
+
+def test_invalidate_skips_cached_results(make_app, add_user):
+    app = make_app()
+
+    with app.app_context():
+        assert names(member_search.search("org", "b")) == []
+        add_user("7", "org", name="Bob", email_address="bob@example.org")
+        assert names(member_search.search("org", "b")) == []
+        member_search.invalidate("org")
+        assert names(member_search.search("org", "b")) == ["Bob"]
+
+
+def test_substring_matches_top_up_prefix_matches(make_app):
+    app = make_app()
+
+    with app.app_context():
+        assert names(member_search.search("org", "ing")) == ["Alan Turing"]
+        assert names(member_search.search("org", "miral")) == ["Grace Hopper"]
+        assert names(member_search.search("org", "ada", limit=3)) == ["Ada Lovelace", "Adam Smith"]
+
+
+def test_no_organisation_has_no_members(make_app, add_user):
+    app = make_app()
+
+    with app.app_context():
+        add_user("7", None, name="Stranger", email_address="stranger@elsewhere.com")
+        assert member_search.search(None, "str") == []
+        assert member_search.prefix_matches(None, "str") == []
+        assert member_search.cache.get(None) is None
+
+
+def test_users_without_an_organisation_cant_search(make_app, add_user, log_in):
+    app = make_app()
+    with app.app_context():
+        add_user("7", None, name="Stranger", email_address="stranger@elsewhere.com")
+        add_user("8", None, name="Nomad", email_address="nomad@elsewhere.com")
+
+    with app.test_client() as test_client:
+        log_in(test_client, "8")
+        response = test_client.get("/organisation/users/search?q=str", base_url="https://localhost")
+
+    assert response.status_code == 403
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytz
+
+from app.timezones import CHOICES, NAMES, get_zone, localise_many, utcnow
+
+
+def test_choices_cover_common_timezones():
+    assert len(CHOICES) == len(pytz.common_timezones)
+    assert ("America/New_York", "America/New York") in CHOICES
+    assert "Europe/London" in NAMES
+
+
+def test_zones_are_cached():
+    assert get_zone("Europe/London") is get_zone("Europe/London")
+
+
+def test_localise_many():
+    values = [datetime(2022, 1, 1, 12, tzinfo=pytz.utc), None, datetime(2022, 7, 1, 12, tzinfo=pytz.utc)]
+    localised = localise_many(values, "Europe/London")
+    assert [value.hour if value else None for value in localised] == [12, None, 13]
+    assert utcnow().tzinfo is pytz.utc